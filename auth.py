@@ -1,5 +1,127 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+
 import streamlit as st
 
+# 資格情報インデックスの再読込間隔（秒）。失効・権限変更をこの間隔で反映する。
+CREDENTIAL_REFRESH_SECONDS = 60
+# 照合に失敗した場合、インデックスがこの秒数より古ければ同期再読込して再照合する。
+CREDENTIAL_MISS_RELOAD_SECONDS = 5
+
+
+def _hash_password(password: str, salt: bytes) -> bytes:
+    return hmac.new(salt, str(password).encode("utf-8"), hashlib.sha256).digest()
+
+
+class _CredentialIndex:
+    """アクセス管理シートを id → (ソルト付きハッシュ, 有効期間) の辞書として保持する。
+
+    平文パスワードはメモリに残さず、ログイン時は辞書引きとハッシュ比較だけで照合する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loaded_at = None
+        self._refresher = None
+
+    def _build(self, df):
+        import pandas as pd
+
+        entries = {}
+        for record in df.to_dict("records"):
+            user_id = record.get("id")
+            password = record.get("password")
+            if pd.isna(user_id) or pd.isna(password):
+                continue
+            salt = os.urandom(16)
+            user_info = {key: value for key, value in record.items() if key != "password"}
+            entries.setdefault(str(user_id), []).append({
+                "salt": salt,
+                "digest": _hash_password(password, salt),
+                "start_date": pd.to_datetime(record.get("perStartDate")),
+                "end_date": pd.to_datetime(record.get("perEndDate")),
+                "user_info": user_info,
+            })
+        return entries
+
+    def refresh(self):
+        """起動時参照シートを一括で読み直し、インデックスとシートのスナップショットを差し替える。"""
+        from process.u_googleSheets import warm_up_sheets
+
+        entries = self._build(warm_up_sheets()["アクセス管理"])
+        with self._lock:
+            self._entries = entries
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """インデックスを破棄し、次回ログイン時にシートから同期再読込させる。"""
+        with self._lock:
+            self._entries = {}
+            self._loaded_at = None
+
+    def _age(self):
+        with self._lock:
+            return None if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    def _has_id(self, user_id):
+        with self._lock:
+            return str(user_id) in self._entries
+
+    def _find(self, user_id, password):
+        with self._lock:
+            candidates = self._entries.get(str(user_id), ())
+        for entry in candidates:
+            if hmac.compare_digest(entry["digest"], _hash_password(password, entry["salt"])):
+                return entry
+        return None
+
+    def lookup(self, user_id, password):
+        """id・パスワードが一致するエントリを返す。見つからなければ None。"""
+        self.start()
+        age = self._age()
+        if age is None or age > CREDENTIAL_REFRESH_SECONDS:
+            self.refresh()
+        entry = self._find(user_id, password)
+        # 別セッションの invalidate() で読込時刻が消えている場合も古いとみなす
+        age = self._age()
+        if entry is None and not self._has_id(user_id) and (age is None or age > CREDENTIAL_MISS_RELOAD_SECONDS):
+            # 直前に追加された利用者を弾かないよう、古いインデックスにない id は再読込して確かめる。
+            # 既知の id のパスワード違いはインデックスだけで不一致とし、シートは読まない。
+            self.refresh()
+            entry = self._find(user_id, password)
+        return entry
+
+    def start(self):
+        """バックグラウンド再読込を開始する。初回はすぐに読み込み、以後は一定間隔で更新する。"""
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Warning: Failed to refresh credential index ({e}).")
+            time.sleep(CREDENTIAL_REFRESH_SECONDS)
+
+
+@st.cache_resource(show_spinner=False)
+def _credential_index() -> _CredentialIndex:
+    return _CredentialIndex()
+
+
+def invalidate_credentials():
+    """利用停止・パスワード変更を即時反映したい場合に呼ぶ。"""
+    _credential_index().invalidate()
+
+
 def login():
     st.markdown("""
         <style>
@@ -23,10 +145,12 @@ def login():
 
     from datetime import datetime
     import pandas as pd
-    from process.u_googleSheets import read_sheet
 
     st.title("Tokumei AI - Login")
 
+    # ログイン画面の表示と同時にシートを一括取得しておき、送信時は辞書引きだけで済ませる。
+    _credential_index().start()
+
     with st.form("login_form"):
         user_id = st.text_input("User ID")
         password = st.text_input("Password", type="password")
@@ -34,21 +158,16 @@ def login():
 
         if submit:
             try:
-                # サービスアカウント経由でアクセス管理シートを読み取る(閲覧制限されたシートのため)
-                df = read_sheet("アクセス管理", ttl=0)
-
-                # Check for matching credentials
-                match = df[(df['id'] == user_id) & (df['password'] == password)]
+                # サービスアカウント経由で読み取ったアクセス管理シートのインデックスで照合する(閲覧制限されたシートのため)
+                match = _credential_index().lookup(user_id, password)
                 
-                if not match.empty:
-                    user_data = match.iloc[0]
-                    
+                if match is not None:
                     # Date validation
                     today = datetime.now().date()
                     
                     # Check for null dates and handle validation
-                    start_date = pd.to_datetime(user_data['perStartDate'])
-                    end_date = pd.to_datetime(user_data['perEndDate'])
+                    start_date = match["start_date"]
+                    end_date = match["end_date"]
                     
                     is_after_start = True
                     if pd.notnull(start_date):
@@ -61,7 +180,7 @@ def login():
                     if is_after_start and is_before_end:
                         st.session_state["authenticated"] = True
                         st.session_state["user_id"] = user_id
-                        st.session_state["user_info"] = user_data.to_dict()
+                        st.session_state["user_info"] = dict(match["user_info"])
                         st.success("Login successful!")
                         st.rerun()
                     else:
@@ -7,6 +7,93 @@ from process.a_standardizeAccountingData import process_journal_single, process_
 from process.b_createDiagnosticReportPdf import create_diagnostic_report
 from process.c_createBusinessList import create_business_list, create_supplier_list
 
+def enqueue_report_uploads(report, pdf_filename: str, excel_filename: str) -> list:
+    """作成済みのPDF・ExcelをGoogle Driveの保存キューへ登録し、ジョブIDを返す。
+
+    レポートの作成スレッドから呼ばれるため、session_state には触れない。
+    """
+    try:
+        from process.u_googleDrive import enqueue_upload_to_drive
+        return [
+            enqueue_upload_to_drive(report.pdf_bytes(), pdf_filename, "application/pdf"),
+            enqueue_upload_to_drive(
+                report.excel_bytes(),
+                excel_filename,
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            ),
+        ]
+    except Exception as e:
+        print(f"Failed to import/execute Google Drive upload: {e}")
+        return []
+
+# 保存ジョブの終了状態（これ以外の状態のジョブがある間だけ進捗を更新し続ける）
+DRIVE_UPLOAD_TERMINAL_STATES = ("success", "failed", "unknown")
+
+def _drive_upload_job_ids():
+    """保存ジョブのID一覧。PDF・Excelの作成中は None、作成や登録に失敗した場合は空リスト。"""
+    jobs = st.session_state.get("drive_upload_jobs")
+    if jobs is None or not jobs.done():
+        return None
+    if jobs.exception() is not None:
+        return []
+    return jobs.result()
+
+def _drive_upload_in_progress() -> bool:
+    """PDF・Excelの作成待ち、または送信が終わっていない保存ジョブがあるか。"""
+    if st.session_state.get("drive_upload_jobs") is None:
+        return False
+    job_ids = _drive_upload_job_ids()
+    if job_ids is None:
+        return True
+    if not job_ids:
+        return False
+    from process.u_googleDrive import get_upload_status
+
+    return any(get_upload_status(job_id).get("state") not in DRIVE_UPLOAD_TERMINAL_STATES for job_id in job_ids)
+
+def _render_drive_upload_status() -> bool:
+    """Google Driveへの保存の進捗を表示し、まだ作成中・送信中なら True を返す。
+
+    保存キューへの登録はレポートの作成側で行うため、ここでは状態を表示するだけにする。
+    """
+    if st.session_state.get("drive_upload_jobs") is None:
+        return False
+    job_ids = _drive_upload_job_ids()
+    if job_ids is None:
+        st.caption("⏳ レポートを作成しています...")
+        return True
+    if not job_ids:
+        st.session_state["drive_upload_success"] = False
+        st.caption("⚠️ レポートの保存に失敗しました（ダウンロードには影響ありません）")
+        return False
+    from process.u_googleDrive import get_upload_status
+
+    states = [get_upload_status(job_id).get("state") for job_id in job_ids]
+    if all(state == "success" for state in states):
+        st.session_state["drive_upload_success"] = True
+        st.caption("✅ レポートの保存が完了しました")
+        return False
+    if any(state in ("failed", "unknown") for state in states):
+        st.session_state["drive_upload_success"] = False
+        st.caption("⚠️ レポートの保存に失敗しました（ダウンロードには影響ありません）")
+    else:
+        st.caption("⏳ レポートを保存しています...")
+    return any(state not in DRIVE_UPLOAD_TERMINAL_STATES for state in states)
+
+@st.fragment(run_every="5s")
+def _poll_drive_upload_status():
+    """保存の進捗を、レポート表示とは独立に5秒ごとに更新する。"""
+    if not _render_drive_upload_status():
+        # 全ジョブが終わったらアプリ全体を再実行し、定期更新しない表示へ切り替える
+        st.rerun()
+
+def show_drive_upload_status():
+    """Google Driveへのバックグラウンド保存の進捗。作成中・送信中のジョブがある間だけ定期更新する。"""
+    if _drive_upload_in_progress():
+        _poll_drive_upload_status()
+    else:
+        _render_drive_upload_status()
+
 def show_main():
     # PC前提のワイドレイアウト設定
     st.set_page_config(page_title="特命AI", layout="wide", initial_sidebar_state="collapsed")
@@ -298,32 +385,17 @@ def show_main():
                         # セッション状態に保存
                         st.session_state["standardized_journal"] = std_data["journal"]
                         st.session_state["standardized_bs"] = std_data["bs"]
-                        st.session_state["report_pdf_bytes"] = report_data["pdf_bytes"]
                         st.session_state["report_preview_md"] = report_data["preview_md"]
                         st.session_state["report_analysis_df"] = report_data["analysis_df"]
-                        st.session_state["report_excel_bytes"] = report_data["excel_bytes"]
+                        # PDF・Excelはバックグラウンドで作成し、作成でき次第Google Driveの保存キューへ登録する
+                        report = report_data["report"]
+                        st.session_state["diagnostic_report"] = report
                         st.session_state["pdf_filename"] = pdf_filename
                         st.session_state["excel_filename"] = excel_filename
-                        
-                        # Google Driveへ自動アップロード
-                        try:
-                            from process.u_googleDrive import upload_pdf_to_drive, upload_file_to_drive
-                            # PDFのアップロード
-                            pdf_file_id = upload_pdf_to_drive(report_data["pdf_bytes"], pdf_filename)
-                            # Excelのアップロード
-                            excel_file_id = upload_file_to_drive(
-                                report_data["excel_bytes"],
-                                excel_filename,
-                                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                            )
-                            
-                            if pdf_file_id and excel_file_id:
-                                st.session_state["drive_upload_success"] = True
-                            else:
-                                st.session_state["drive_upload_success"] = False
-                        except Exception as e:
-                            print(f"Failed to import/execute Google Drive upload: {e}")
-                            st.session_state["drive_upload_success"] = False
+                        st.session_state["drive_upload_jobs"] = report.when_rendered(
+                            lambda r: enqueue_report_uploads(r, pdf_filename, excel_filename)
+                        )
+                        st.session_state["drive_upload_success"] = None
                         
                         # フラグ管理
                         st.session_state["report_ready"] = True
@@ -410,10 +482,12 @@ def show_main():
         
         # 5.2 診断レポート ダウンロードボタン
         pdf_filename = st.session_state.get("pdf_filename", f"特命AI_診断レポート_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.pdf")
+        # PDF・Excelはクリック時に作成する（バックグラウンドで作成済みならそれを使う）
+        report = st.session_state.get("diagnostic_report")
 
         st.download_button(
             label="診断レポート(PDF)をダウンロード",
-            data=st.session_state.get("report_pdf_bytes", b""),
+            data=report.pdf_bytes if report is not None else b"",
             file_name=pdf_filename,
             mime="application/pdf",
             use_container_width=True
@@ -423,12 +497,14 @@ def show_main():
         excel_filename = st.session_state.get("excel_filename", f"特命AI_銀行説明用リスト_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.xlsx")
         st.download_button(
             label="銀行説明用リスト(Excel)をダウンロード",
-            data=st.session_state.get("report_excel_bytes", b""),
+            data=report.excel_bytes if report is not None else b"",
             file_name=excel_filename,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             use_container_width=True
         )
         
+        show_drive_upload_status()
+
         st.markdown("<br><br>", unsafe_allow_html=True)
         st.divider()
 
@@ -1,21 +1,111 @@
+import threading
 import pandas as pd
-from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
 
 from process.p2_1_exeMiyataLogic import exe_miyata_logic
-from process.p2_2_Template_DiagnosticPDF import render_diagnostic_pdf
-from process.p2_3_createListForBank import create_bank_excel
+from process.p2_2_Template_DiagnosticPDF import build_preview_md, render_diagnostic_pdf
+from process.p2_3_createListForBank import BankSheets, build_bank_sheets
+
+# PDF・Excel の先行作成に使うスレッド数（PDF と Excel を並行して作る）
+RENDER_WORKERS = 2
+
+_render_executor: Optional[ThreadPoolExecutor] = None
+_render_executor_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="report-render")
+        return _render_executor
+
+
+class DiagnosticReport:
+    """診断レポートの分析結果と、PDF・Excel の元になるデータを保持する。
+
+    PDF・Excel のバイト列は初回要求時（ダウンロード時、または render_in_background）に1回だけ作り、
+    以後は同じものを返す。同時に要求された場合は先に始めた作成の完了を待つ。
+    """
+
+    def __init__(self, analysis_df: pd.DataFrame, accounting_period: str, bank_sheets: BankSheets):
+        self.analysis_df = analysis_df
+        self.accounting_period = accounting_period
+        self.bank_sheets = bank_sheets
+        self._renderers: Dict[str, Callable[[], bytes]] = {
+            "pdf": lambda: render_diagnostic_pdf(self.analysis_df, self.accounting_period)[0],
+            "excel": self.bank_sheets.to_excel,
+        }
+        self._artifacts: Dict[str, bytes] = {}
+        self._locks = {name: threading.Lock() for name in self._renderers}
+        self._futures: Dict[str, Future] = {}
+        self._futures_lock = threading.Lock()
+
+    def _artifact(self, name: str) -> bytes:
+        with self._locks[name]:
+            if name not in self._artifacts:
+                print(f"--- DEBUG: 診断レポートの {name} を作成します ---")
+                self._artifacts[name] = self._renderers[name]()
+            return self._artifacts[name]
+
+    def pdf_bytes(self) -> bytes:
+        return self._artifact("pdf")
+
+    def excel_bytes(self) -> bytes:
+        return self._artifact("excel")
+
+    def is_rendered(self) -> bool:
+        """PDF・Excel の両方が作成済みか。"""
+        return all(name in self._artifacts for name in self._renderers)
+
+    def render_in_background(self) -> Dict[str, Future]:
+        """未作成の PDF・Excel をバックグラウンドで作り始める。何度呼んでも作成は1回だけ。"""
+        with self._futures_lock:
+            for name in self._renderers:
+                if name not in self._futures:
+                    self._futures[name] = _executor().submit(self._artifact, name)
+            return dict(self._futures)
+
+    def when_rendered(self, callback: Callable[["DiagnosticReport"], object]) -> Future:
+        """PDF・Excel の作成を始め、両方できたら callback(self) を作成スレッドで呼ぶ。
+
+        画面の表示状態に関係なく呼ばれる。返り値は callback の結果（作成に失敗した場合はその例外）の Future。
+        """
+        futures = list(self.render_in_background().values())
+        done: Future = Future()
+        pending = [len(futures)]
+        pending_lock = threading.Lock()
+
+        def _on_rendered(_):
+            with pending_lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            try:
+                for future in futures:
+                    future.result()
+                done.set_result(callback(self))
+            except Exception as e:
+                done.set_exception(e)
+
+        for future in futures:
+            future.add_done_callback(_on_rendered)
+        return done
+
 
 def create_diagnostic_report(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Dict:
     """
     診断レポート作成のメインプロセス。
-    銀行説明用エクセルの作成 ＆ 売上計上思想指数の算出 -> 分析(MiyataLogic)実行 -> PDF化を行い、結果を返す。
+    銀行説明用リストの各シート作成 ＆ 売上計上思想指数の算出 -> 分析(MiyataLogic)実行 -> プレビュー作成を行い、結果を返す。
+    PDF・Excel は返り値の "report"（DiagnosticReport）から必要になった時点で作成する。
     """
-    # 1. 銀行説明用エクセルの作成 ＆ 売上計上思想指数の算出
-    excel_bytes, sales_index_data = create_bank_excel(df_journal, df_bs)
-    
+    # 1. 銀行説明用リストの各シート作成 ＆ 売上計上思想指数の算出
+    bank_sheets, sales_index_data = build_bank_sheets(df_journal, df_bs)
+
     # 2. 分析実行（売上計上思想指数などを注入）
     analysis_results = exe_miyata_logic(df_journal, df_bs, sales_index_data)
-    
+
     # 3. 会計期間の取得
     df_j = df_journal.copy()
     df_j['date'] = pd.to_datetime(df_j['date'], errors='coerce')
@@ -27,13 +117,11 @@ def create_diagnostic_report(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> D
     else:
         accounting_period = "不明"
 
-    # 4. PDF生成 & プレビュー生成
-    pdf_bytes, preview_md = render_diagnostic_pdf(analysis_results, accounting_period)
-    
+    # 4. プレビュー生成（PDFは DiagnosticReport が必要時に生成）
+    preview_md = build_preview_md(analysis_results)
+
     return {
-        "pdf_bytes": pdf_bytes,
         "preview_md": preview_md,
         "analysis_df": analysis_results,
-        "excel_bytes": excel_bytes
+        "report": DiagnosticReport(analysis_results, accounting_period, bank_sheets),
     }
-
@@ -2,30 +2,31 @@ import pandas as pd
 import json
 from typing import Dict, Tuple
 from process.u_accessGemini import exe_gemini_withGoogleSearch_and_structure
-from process.partner_resolution import resolve_partner_columns
-from process.transaction_details import build_purchase_details, build_sales_details
-from process.u_googleSheets import read_sheet
+from process.resolved_journal import ResolvedJournal
+from process.u_googleSheets import read_startup_sheet
 import streamlit as st
 
 def create_business_list(df_journal: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """営業先リストを作成する（スプレッドシートのB2セルを使用）"""
     target_accounts = ["売上高", "売掛金", "受取手形"]
-    return _create_list_common(df_journal, row_idx=1, col_idx=1, target_accounts=target_accounts, fallback_name="営業先", partner_column="sales_partner", detail_builder=build_sales_details)
+    return _create_list_common(df_journal, row_idx=1, col_idx=1, target_accounts=target_accounts, fallback_name="営業先", partner_column="sales_partner", detail_builder=ResolvedJournal.sales_details)
 
 def create_supplier_list(df_journal: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """仕入先リストを作成する（スプレッドシートのB3セルを使用）"""
     target_accounts = ["外注費", "仕入高"]
-    return _create_list_common(df_journal, row_idx=2, col_idx=1, target_accounts=target_accounts, fallback_name="仕入先", partner_column="purchase_partner", detail_builder=build_purchase_details)
+    return _create_list_common(df_journal, row_idx=2, col_idx=1, target_accounts=target_accounts, fallback_name="仕入先", partner_column="purchase_partner", detail_builder=ResolvedJournal.purchase_details)
 
 def _create_list_common(df_journal: pd.DataFrame, row_idx: int, col_idx: int, target_accounts: list, fallback_name: str, partner_column: str, detail_builder=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     営業先・仕入先リスト作成の共通ロジック。
     """
     # 1. 取引先一覧を抽出
-    df_journal = resolve_partner_columns(df_journal)
+    # 診断レポート作成時に同じ仕訳から作った取引先別明細があれば、それを再利用する。
+    journal = ResolvedJournal.of(df_journal)
+    df_journal = journal.frame
     partners = set()
     if detail_builder is not None:
-        details = detail_builder(df_journal)
+        details = detail_builder(journal)
         partners.update(details.loc[details['partner'] != '取引先不明', 'partner'].dropna().unique())
     # 借方・貸方のいずれかに指定科目が含まれる場合、その行の取引先を取得
     mask_debit = df_journal["debit_account"].fillna("").str.contains("|".join(target_accounts))
@@ -39,7 +40,7 @@ def _create_list_common(df_journal: pd.DataFrame, row_idx: int, col_idx: int, ta
     
     # 2. Googleスプレッドシートからプロンプトを取得(サービスアカウント経由)
     try:
-        df_prompt = read_sheet("AIプロンプト", header=None, ttl=0)
+        df_prompt = read_startup_sheet("AIプロンプト")
         base_prompt = df_prompt.iloc[row_idx, col_idx] if df_prompt.shape[0] > row_idx and df_prompt.shape[1] > col_idx else ""
     except Exception as e:
         print(f"Error fetching prompt: {e}")
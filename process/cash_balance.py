@@ -0,0 +1,45 @@
+"""仕訳の現預金増減から日次残高を逆算し、月末・月内最低残高を求める。"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+
+CASH_ACCOUNT_PATTERN = "預金|現金|当座|普通"
+
+
+def cash_movements(journal: pd.DataFrame) -> pd.Series:
+    """行ごとの現預金増減。借方に現預金科目があればプラス、貸方にあればマイナス。"""
+    debit_is_cash = journal["debit_account"].str.contains(CASH_ACCOUNT_PATTERN, na=False)
+    credit_is_cash = journal["credit_account"].str.contains(CASH_ACCOUNT_PATTERN, na=False)
+    return journal["debit_amount"].where(debit_is_cash, 0) - journal["credit_amount"].where(credit_is_cash, 0)
+
+
+def daily_balances(dates: pd.Series, movements: pd.Series, anchor_balance: float, anchor_date=None) -> pd.Series:
+    """日付ごとの当日終了時点の残高（日付昇順）。
+
+    anchor_date 終了時点の残高が anchor_balance になるよう、日次増減の累積和をずらして求める。
+    anchor_date を省略すると最終日を基準にする（期末の B/S 残高から遡る場合）。
+    """
+    daily = movements.groupby(dates).sum().sort_index()
+    cumulative = daily.cumsum()
+    if anchor_date is None:
+        anchor_total = cumulative.iloc[-1] if len(cumulative) else 0.0
+    else:
+        position = cumulative.index.searchsorted(pd.Timestamp(anchor_date), side="right")
+        anchor_total = cumulative.iloc[position - 1] if position > 0 else 0.0
+    return (anchor_balance - anchor_total + cumulative).rename("balance")
+
+
+def monthly_balance_summary(balances: pd.Series) -> pd.DataFrame:
+    """日次残高（日付昇順）から、月ごとの月末残高・月内最低残高とその日付。最低残高が並ぶ日は早い日を採る。"""
+    frame = pd.DataFrame({"date": balances.index, "balance": balances.to_numpy()})
+    months = frame["date"].dt.to_period("M")
+    grouped = frame.groupby(months)
+    minimum_rows = frame.loc[grouped["balance"].idxmin()]
+    return pd.DataFrame({
+        "year_month": grouped.size().index,
+        "end_balance": grouped["balance"].last().to_numpy(),
+        "min_balance": minimum_rows["balance"].to_numpy(),
+        "min_date": minimum_rows["date"].to_numpy(),
+    })
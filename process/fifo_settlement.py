@@ -0,0 +1,58 @@
+"""債務（発生）へ支払（回収）を古い順に充当する FIFO 消込と、未消込残の滞留区分。"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def settle_fifo(obligation_amounts, payment_amounts, obligation_dates=None, payment_dates=None) -> np.ndarray:
+    """支払を渡した順に、古い債務から充当した後の債務ごとの残額を返す。
+
+    日付を渡すと、各支払は支払日以前に発生した債務にだけ充当する（obligation_dates は昇順であること）。
+    消込済みの債務は先頭から連続するため、次の充当先を指す位置を進めるだけで全体を一度なぞれば済む。
+    """
+    remaining = np.array(obligation_amounts, dtype=float)
+    count = len(remaining)
+    if obligation_dates is not None:
+        obligation_dates = pd.DatetimeIndex(obligation_dates)
+    head = 0
+    for position, amount in enumerate(np.asarray(payment_amounts, dtype=float)):
+        limit = count if payment_dates is None else obligation_dates.searchsorted(payment_dates[position], side="right")
+        index = head
+        while amount > 0 and index < limit:
+            if remaining[index] > 0:
+                applied = min(remaining[index], amount)
+                remaining[index] -= applied
+                amount -= applied
+            if not remaining[index] > 0:
+                index += 1
+        while head < count and not remaining[head] > 0:
+            head += 1
+    return remaining
+
+
+def settle_fifo_grouped(groups, amounts, payments) -> np.ndarray:
+    """グループごとに、支払総額 payments[group] をそのグループの債務へ古い順に充当した後の残額。
+
+    groups は 0 始まりのグループ番号で昇順に並べ、グループ内は古い順にすること。債務額は非負（欠損は 0）。
+    各債務の手前までに充当した額はグループ内の累積和で求まるので、支払総額の残りが
+    債務額以上なら全額消込、0 以下なら全額未消込、その間なら差額が残る。
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    amounts = np.nan_to_num(np.asarray(amounts, dtype=float), nan=0.0)
+    payments = np.maximum(np.asarray(payments, dtype=float), 0.0)
+    if len(amounts) == 0:
+        return np.zeros(0)
+    # 累積和はグループ内で取り、他の取引先の金額の丸め誤差を持ち込まない
+    cumulative = pd.Series(amounts).groupby(groups).cumsum().to_numpy()
+    prior = np.concatenate(([0.0], cumulative[:-1]))
+    prior[np.concatenate(([True], groups[1:] != groups[:-1]))] = 0.0
+    available = payments[groups] - prior
+    return np.where(available >= amounts, 0.0, np.where(available > 0, amounts - available, amounts))
+
+
+def aging_buckets(dates, base_date, bounds) -> tuple[np.ndarray, np.ndarray]:
+    """base_date 時点の経過日数と、bounds（昇順の日数下限）のどこに入るかの番号を返す。最小の下限未満は -1。"""
+    days = (pd.Timestamp(base_date) - pd.DatetimeIndex(dates)).days.to_numpy()
+    return days, np.searchsorted(np.asarray(bounds), days, side="right") - 1
@@ -0,0 +1,56 @@
+"""仕訳の月次損益系列（売上・原価・買掛等）を、科目マスクと1回のグループ集計で作る。"""
+
+from __future__ import annotations
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# 系列名 → (借方・貸方いずれかの科目名に含まれる語, 集計する金額列)。月次の指標を増やす場合はここに足す。
+MONTHLY_SERIES = {
+    "sales_amt": (("売上", "売上高"), "credit_amount"),
+    # 粗利率ブレ用に「未収入金」を含めた売上高
+    "sales_amt_margin": (("売上", "売上高", "未収入金"), "credit_amount"),
+    "cogs_amt": (("仕入", "売上原価", "外注費"), "debit_amount"),
+    "ap_amt": (("買掛金", "未払金", "未払費用"), "credit_amount"),
+}
+
+# 粗利率の系列名 → 分母にする売上系列。原価は cogs_amt。
+MARGIN_SERIES = {
+    "margin": "sales_amt",
+    "margin_with_receivables": "sales_amt_margin",
+}
+
+
+def contains_any(values: pd.Series, patterns) -> pd.Series:
+    """文字列にした値が patterns のどれかを含むか。欠損は "nan" として判定する。"""
+    pattern = "|".join(re.escape(p) for p in patterns)
+    return values.astype(str).str.contains(pattern, regex=True)
+
+
+def account_mask(journal: pd.DataFrame, patterns) -> pd.Series:
+    """借方・貸方いずれかの科目名が patterns のどれかを含む行。"""
+    return contains_any(journal["debit_account"], patterns) | contains_any(journal["credit_account"], patterns)
+
+
+def monthly_pl(journal: pd.DataFrame, series: dict = MONTHLY_SERIES, margins: dict = MARGIN_SERIES) -> pd.DataFrame:
+    """date（datetime）を持つ仕訳から、月（Period）ごとの各系列の合計と粗利率を返す。
+
+    売上・原価は行の科目で判定した金額を単純合算する簡易集計で、勘定科目ごとの貸借は見ない。
+    粗利率は売上0の月を0とする。
+    """
+    amounts = {}
+    for name, (patterns, amount_column) in series.items():
+        values = pd.to_numeric(journal[amount_column], errors="coerce").fillna(0)
+        amounts[name] = values.where(account_mask(journal, patterns), 0)
+    frame = pd.DataFrame(amounts, index=journal.index, columns=list(series))
+    stats = frame.groupby(journal["date"].dt.to_period("M")).sum()
+    stats.index.name = "year_month"
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name, sales_column in margins.items():
+            margin = (stats[sales_column] - stats["cogs_amt"]) / stats[sales_column]
+            stats[name] = margin.replace([np.inf, -np.inf], np.nan).fillna(0)
+    return stats
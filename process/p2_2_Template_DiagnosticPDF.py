@@ -4,7 +4,7 @@ import os
 from fpdf import FPDF
 from fpdf.fonts import FontFace
 import datetime
-from process.u_googleSheets import read_sheet
+from process.u_googleSheets import read_startup_sheet
 
 # 「問題の本質」の定型文マッピング
 ESSENCE_MAP = {
@@ -35,7 +35,7 @@ def load_essence_map() -> dict:
     """
     essence = ESSENCE_MAP.copy()
     try:
-        df_sheet = read_sheet("問題の本質", header=None, ttl=0)
+        df_sheet = read_startup_sheet("問題の本質")
 
         # 取得するのはA2～B25程度（ヘッダー行を除くため、index 1から）
         max_rows = min(df_sheet.shape[0], 26)  # B25くらいまでなら最大26行
@@ -53,6 +53,35 @@ def load_essence_map() -> dict:
         print(f"Warning: Error loading Essence Map from Google Sheet ({e}). Using fallback map.")
     return essence
 
+def summarize_red_signals(analysis_df: pd.DataFrame) -> str:
+    """赤信号の件数に応じた概要メッセージ。"""
+    red_count = len(analysis_df[analysis_df["color"] == "red"])
+    if red_count == 0:
+        return "経営の存続に関わる【赤信号】はありませんでした。"
+    elif red_count == 1:
+        return "経営の存続に関わる【赤信号】が一つありました。"
+    else:
+        return "経営の存続に関わる複数の【赤信号】がありました。"
+
+
+def build_preview_md(analysis_df: pd.DataFrame) -> str:
+    """分析結果のDataFrameから、プレビュー用テキスト（Markdown、上位3項目）を生成する。PDFは作らない。"""
+    preview_md = f"### {summarize_red_signals(analysis_df)}\n\n"
+    preview_md += "| 評価項目 | 結果 | コメント |\n| :--- | :--- | :--- |\n"
+    
+    # 赤は最優先、黄色があれば次に優先、それ以降は元々の順番通りに抽出
+    red_rows = analysis_df[analysis_df["color"] == "red"]
+    yellow_rows = analysis_df[analysis_df["color"] == "yellow"]
+    other_rows = analysis_df[~analysis_df["color"].isin(["red", "yellow"])]
+    preview_rows = pd.concat([red_rows, yellow_rows, other_rows]).head(3)
+
+    for _, row in preview_rows.iterrows():
+        color_val = str(row.get("color", "grey"))
+        emoji = "🔴" if color_val == "red" else "🟡" if color_val == "yellow" else "🔵" if color_val == "blue" else "⚪"
+        preview_md += f"| {row['item']} | {emoji} {row['result']} | {row['comment']} |\n"
+    return preview_md
+
+
 def render_diagnostic_pdf(analysis_df: pd.DataFrame, accounting_period: str) -> tuple[bytes, str]:
     """
     分析結果のDataFrameから、PDFデータ（バイナリ）とプレビュー用テキスト（Markdown）を生成する。
@@ -104,12 +133,7 @@ def render_diagnostic_pdf(analysis_df: pd.DataFrame, accounting_period: str) ->
     
     # ② 分析結果の概要
     red_count = len(analysis_df[analysis_df["color"] == "red"])
-    if red_count == 0:
-        summary_msg = "経営の存続に関わる【赤信号】はありませんでした。"
-    elif red_count == 1:
-        summary_msg = "経営の存続に関わる【赤信号】が一つありました。"
-    else:
-        summary_msg = "経営の存続に関わる複数の【赤信号】がありました。"
+    summary_msg = summarize_red_signals(analysis_df)
     
     pdf.set_font_size(12)
     pdf.cell(0, 10, f"貴社の会計データを「特命AI財務分析ロジック」で分析した結果", new_x="LMARGIN", new_y="NEXT", align="C")
@@ -181,18 +205,6 @@ def render_diagnostic_pdf(analysis_df: pd.DataFrame, accounting_period: str) ->
     pdf_bytes = bytes(pdf.output())
 
     # --- 2. プレビュー用 Markdown ---
-    preview_md = f"### {summary_msg}\n\n"
-    preview_md += "| 評価項目 | 結果 | コメント |\n| :--- | :--- | :--- |\n"
-    
-    # 赤は最優先、黄色があれば次に優先、それ以降は元々の順番通りに抽出
-    red_rows = analysis_df[analysis_df["color"] == "red"]
-    yellow_rows = analysis_df[analysis_df["color"] == "yellow"]
-    other_rows = analysis_df[~analysis_df["color"].isin(["red", "yellow"])]
-    preview_rows = pd.concat([red_rows, yellow_rows, other_rows]).head(3)
+    preview_md = build_preview_md(analysis_df)
 
-    for _, row in preview_rows.iterrows():
-        color_val = str(row.get("color", "grey"))
-        emoji = "🔴" if color_val == "red" else "🟡" if color_val == "yellow" else "🔵" if color_val == "blue" else "⚪"
-        preview_md += f"| {row['item']} | {emoji} {row['result']} | {row['comment']} |\n"
-    
     return pdf_bytes, preview_md
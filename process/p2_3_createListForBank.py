@@ -1,21 +1,35 @@
 import pandas as pd
 import numpy as np
 import io
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 from openpyxl.chart import LineChart, Reference
 from openpyxl.chart.layout import Layout, ManualLayout
-from typing import Tuple, Dict
-from process.partner_resolution import resolve_partner_columns
+from openpyxl.chart.text import RichText
+from openpyxl.drawing.text import RichTextProperties
+from typing import Callable, Tuple, Dict
+from process.resolved_journal import ResolvedJournal
 from process.transaction_details import (
     build_direct_sales_details,
     consolidate_partner_aliases,
-    resolve_payment_partner_name,
+    resolve_payment_partner_names,
 )
 from process.capital_movement import build_capital_movement_list
+from process.cash_balance import cash_movements, daily_balances, monthly_balance_summary
+from process.fifo_settlement import aging_buckets, settle_fifo_grouped
 
 VALID_TRANSACTION_NULL_STRINGS = {"", "nan", "none", "null", "<na>"}
+# 長期未回収売掛の滞留区分（経過日数の下限と評価）
+AR_AGING_BOUNDS = (31, 61, 91)
+AR_AGING_LABELS = ("⚠️注意", "🔶要整理", "🔴長期滞留")
+# 銀行説明用リストのシートを並列に作るスレッド数
+BANK_SHEET_WORKERS = 4
 
 
 def has_valid_transaction_no(value) -> bool:
@@ -102,67 +116,79 @@ def build_sales_receipt_list(df_receipts: pd.DataFrame, journal: pd.DataFrame) -
         return pd.DataFrame(columns=columns)
 
     fee_mask = journal["debit_account"].fillna("").astype(str).str.contains("支払手数料", na=False)
-    fees = journal[fee_mask].copy()
-    fees["_fee_amount"] = pd.to_numeric(fees["debit_amount"], errors="coerce").fillna(0.0)
-    used_fee_indices = set()
-    records = []
-
-    for _, row in df_receipts.iterrows():
-        gross_value = pd.to_numeric(row.get("credit_amount"), errors="coerce")
-        net_value = pd.to_numeric(row.get("debit_amount"), errors="coerce")
-        gross = 0.0 if pd.isna(gross_value) else float(gross_value)
-        net = 0.0 if pd.isna(net_value) else float(net_value)
-        difference = max(gross - net, 0.0)
-        matched_fee = 0.0
-
-        transaction_no = row.get("transaction_no")
-        if has_valid_transaction_no(transaction_no) and difference > 0:
-            candidates = fees[
-                (fees["transaction_no"] == transaction_no)
-                & (~fees.index.isin(used_fee_indices))
-                & ((fees["_fee_amount"] - difference).abs() <= 1.0)
-            ]
-            if not candidates.empty:
-                fee_index = candidates.index[0]
-                matched_fee = float(candidates.loc[fee_index, "_fee_amount"])
-                used_fee_indices.add(fee_index)
-
-        status = "一致" if difference == 0 else ("手数料一致" if matched_fee > 0 else "差額要確認")
-        partner = row.get("ar_partner")
-        if pd.isna(partner):
-            partner = row.get("credit_partner")
-        records.append({
-            "日付": row.get("date"), "金額": net, "売掛金回収額": gross,
-            "実入金額": net, "差額": gross - net, "振込手数料": matched_fee,
-            "対応状態": status, "相手科目(借方/貸方)": row.get("credit_account"),
-            "摘要": row.get("description"), "貸方補助科目": partner,
-        })
-    return pd.DataFrame(records, columns=columns).sort_values("日付")
+    fees = journal[fee_mask]
+    fee_amounts = pd.to_numeric(fees["debit_amount"], errors="coerce").fillna(0.0)
+    # 取引Noごとの未使用の支払手数料（仕訳順）。照合は取引Noの辞書引きと金額差の許容判定だけで行う。
+    fee_queues = {}
+    for transaction_no, fee_amount in zip(fees["transaction_no"], fee_amounts):
+        fee_queues.setdefault(transaction_no, []).append(float(fee_amount))
+
+    def column(name):
+        if name in df_receipts.columns:
+            return df_receipts[name]
+        return pd.Series(None, index=df_receipts.index, dtype=object)
+
+    gross = pd.to_numeric(column("credit_amount"), errors="coerce").fillna(0.0).astype(float).to_numpy()
+    net = pd.to_numeric(column("debit_amount"), errors="coerce").fillna(0.0).astype(float).to_numpy()
+    difference = np.maximum(gross - net, 0.0)
+    matched_fee = np.zeros(len(df_receipts))
+
+    matchable = column("transaction_no").map(has_valid_transaction_no).to_numpy(dtype=bool) & (difference > 0)
+    transaction_nos = column("transaction_no").to_numpy()
+    for position in np.flatnonzero(matchable):
+        queue = fee_queues.get(transaction_nos[position])
+        if not queue:
+            continue
+        for queue_position, fee_amount in enumerate(queue):
+            if abs(fee_amount - difference[position]) <= 1.0:
+                matched_fee[position] = fee_amount
+                del queue[queue_position]
+                break
+
+    status = np.select(
+        [difference == 0, matched_fee > 0], ["一致", "手数料一致"], default="差額要確認"
+    )
+    ar_partner = column("ar_partner")
+    partner = ar_partner.mask(ar_partner.isna(), column("credit_partner"))
+    records = pd.DataFrame({
+        "日付": column("date").to_numpy(), "金額": net, "売掛金回収額": gross,
+        "実入金額": net, "差額": gross - net, "振込手数料": matched_fee,
+        "対応状態": status, "相手科目(借方/貸方)": column("credit_account").to_numpy(),
+        "摘要": column("description").to_numpy(), "貸方補助科目": partner.to_numpy(),
+    }, columns=columns)
+    return records.sort_values("日付")
+
+# 負額仕訳の借貸反転で入れ替える借方・貸方の列の組。
+SWAPPED_SIDE_COLUMNS = (("debit_account", "credit_account"), ("debit_partner", "credit_partner"))
+
 
 def cleanse_journal(df: pd.DataFrame) -> pd.DataFrame:
     """
     仕訳データのクレンジング処理。
     借方金額または貸方金額にマイナス値がある場合、それを正の数に変換し、
     debit/creditを反転させるクレンジングを行う。
+    反転した行数は戻り値の attrs["flipped_rows"] に入れ、ログにも出す。
     """
     df_clean = df.copy()
-    
-    # 借方金額がマイナスの場合の処理
-    debit_minus = df_clean['debit_amount'] < 0
-    if debit_minus.any():
-        for idx in df_clean[debit_minus].index:
-            row = df_clean.loc[idx]
-            df_clean.loc[idx, ['debit_amount', 'credit_amount', 'debit_account', 'credit_account', 'debit_partner', 'credit_partner']] = \
-                [0.0, abs(row['debit_amount']), row['credit_account'], row['debit_account'], row['credit_partner'], row['debit_partner']]
-                
-    # 貸方金額がマイナスの場合の処理
-    credit_minus = df_clean['credit_amount'] < 0
-    if credit_minus.any():
-        for idx in df_clean[credit_minus].index:
-            row = df_clean.loc[idx]
-            df_clean.loc[idx, ['debit_amount', 'credit_amount', 'debit_account', 'credit_account', 'debit_partner', 'credit_partner']] = \
-                [abs(row['credit_amount']), 0.0, row['credit_account'], row['debit_account'], row['credit_partner'], row['debit_partner']]
-                
+
+    # 借方金額がマイナスの行を先に反転し、反転後も貸方金額がマイナスの行を反転する。
+    debit_amount = df_clean['debit_amount']
+    credit_amount = df_clean['credit_amount']
+    debit_minus = debit_amount < 0
+    credit_minus = ~debit_minus & (credit_amount < 0)
+    flipped = debit_minus | credit_minus
+
+    if flipped.any():
+        df_clean['debit_amount'] = debit_amount.mask(debit_minus, 0.0).mask(credit_minus, credit_amount.abs())
+        df_clean['credit_amount'] = credit_amount.mask(debit_minus, debit_amount.abs()).mask(credit_minus, 0.0)
+        for debit_column, credit_column in SWAPPED_SIDE_COLUMNS:
+            debit_values = df_clean[debit_column]
+            credit_values = df_clean[credit_column]
+            df_clean[debit_column] = debit_values.mask(flipped, credit_values)
+            df_clean[credit_column] = credit_values.mask(flipped, debit_values)
+        print(f"--- DEBUG: マイナス金額の仕訳 {int(flipped.sum())}件の借方・貸方を反転しました ---")
+
+    df_clean.attrs["flipped_rows"] = int(flipped.sum())
     return df_clean
 
 
@@ -180,17 +206,282 @@ def select_long_ar_fill_key(origin_value, evaluation_value):
         return "yellow"
     return None
 
+# ==========================================================
+# Excel出力（write-only モードで行ごとに書き出す）
+# ==========================================================
+BANK_FONT_NAME = "BIZ UDゴシック"
+# select_long_ar_fill_key のキー → 行の背景色
+LONG_AR_FILL_COLORS = {"grey": "E7E6E6", "red": "FFE8E8", "orange": "FFF3E0", "yellow": "FFFDE7"}
+# 「資金移動用途推定」シートで折り返し表示する列
+WRAPPED_TRANSFER_COLUMNS = ("資金移動日", "資金移動仕訳", "用途推定仕訳")
+# 自動調整する列幅の全列合計の上限と、縮小時の最小幅
+MAX_TOTAL_COLUMN_WIDTH = 200
+MIN_SCALED_COLUMN_WIDTH = 8
+
+# 書式の種類 → (横位置, 表示形式)
+_CELL_KINDS = {
+    "text": ("left", "General"),
+    "date": ("center", "General"),
+    "amount": ("right", "#,##0"),
+    "rate": ("right", "0.0%"),
+}
+
+
+def display_width(value) -> int:
+    """セルに書く値の表示幅（改行ごとの最大）。ASCII 以外の文字は全角として2幅で数える。"""
+    return max(sum(2 if ord(c) > 127 else 1 for c in line) for line in str(value or '').split('\n'))
+
+
+def to_excel_value(value, column_name: str):
+    """DataFrame の値を (セルに書く値, 書式の種類) にする。"""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d'), "date"
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        if column_name == "金額差率（未充当率）":
+            return value, "rate"
+        if "金額" in column_name or column_name in ("月末残高", "月内最低残高", "滞留日数"):
+            return value, "amount"
+        return value, "text"
+    return (str(value) if pd.notna(value) else ""), "text"
+
+
+def auto_column_widths(columns, rows) -> list:
+    """ヘッダーと書き込む値から列幅を決める。全列合計が上限を超える場合は比率で縮める。"""
+    widths = []
+    for col_idx, col_name in enumerate(columns):
+        max_len = max([display_width(col_name)] + [display_width(row[col_idx][0]) for row in rows])
+        # 推奨幅（文字数 + バッファ）
+        widths.append(max(max_len + 4, 12))
+    total_width = sum(widths)
+    if total_width > MAX_TOTAL_COLUMN_WIDTH:
+        scale_factor = MAX_TOTAL_COLUMN_WIDTH / total_width
+        widths = [max(w * scale_factor, MIN_SCALED_COLUMN_WIDTH) for w in widths]
+    return widths
+
+
+class BankWorkbookStyles:
+    """銀行提出用リストの名前付きスタイル。使われた組み合わせだけをブックに登録し、全セルで共有する。"""
+
+    def __init__(self, wb):
+        self.wb = wb
+        border_thin = Side(border_style="thin", color="D3D3D3")
+        self.border = Border(left=border_thin, right=border_thin, top=border_thin, bottom=border_thin)
+        self.font_regular = Font(name=BANK_FONT_NAME, size=10)
+        self._registered = set()
+        self._cell_styles = {}
+
+    def _register(self, style: NamedStyle) -> str:
+        if style.name not in self._registered:
+            self.wb.add_named_style(style)
+            self._registered.add(style.name)
+        return style.name
+
+    def header(self) -> str:
+        return self._register(NamedStyle(
+            name="bank_header",
+            font=Font(name=BANK_FONT_NAME, size=11, color="FFFFFF", bold=True),
+            fill=PatternFill(start_color="1B365D", end_color="1B365D", fill_type="solid"),
+            alignment=Alignment(horizontal="center", vertical="center"),
+            border=self.border,
+        ))
+
+    def note(self) -> str:
+        return self._register(NamedStyle(name="bank_note", font=Font(name=BANK_FONT_NAME, size=10, bold=True)))
+
+    def cell(self, kind: str, fill_key=None, top: bool = False, wrap: bool = False) -> str:
+        """データセルのスタイル名。top は縦位置上揃え、wrap は左上揃えの折り返し。"""
+        key = (kind, fill_key, top, wrap)
+        if key in self._cell_styles:
+            return self._cell_styles[key]
+        name = "_".join(["bank", kind] + ([fill_key] if fill_key else []) + (["top"] if top else []) + (["wrap"] if wrap else []))
+        horizontal, number_format = _CELL_KINDS[kind]
+        if wrap:
+            alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
+        else:
+            alignment = Alignment(horizontal=horizontal, vertical="top" if top else "center")
+        style = NamedStyle(name=name, font=self.font_regular, border=self.border,
+                           alignment=alignment, number_format=number_format)
+        if fill_key:
+            color = LONG_AR_FILL_COLORS[fill_key]
+            style.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        self._cell_styles[key] = self._register(style)
+        return self._cell_styles[key]
+
+
+def build_balance_chart(ws, n_rows: int) -> LineChart:
+    """預金体力推移シート（A列: 対象年月、B・C列: 月末残高・月内最低残高）の折れ線グラフ。"""
+    chart = LineChart()
+    chart.title = "預金体力推移（縦軸は「残高(円)」、横軸は「対象年月」）"
+    chart.style = 10
+
+    # グラフのサイズをやや広げて視認性と余白を確保
+    chart.width = 20
+    chart.height = 13
+
+    # プロットエリア自体のレイアウトを設定して、上下左右に白い余白を確保
+    # これにより、タイトル、軸タイトル、軸数値、凡例がグラフ線や枠線と被るのを防ぎます
+    chart.plot_area.layout = Layout(
+        manualLayout=ManualLayout(
+            x=0.15,      # 左余白 (全体を1.0とした割合、左から15%の位置から開始)
+            y=0.15,      # 上余白 (上から15%の位置から開始)
+            w=0.70,      # プロットエリアの幅 (右側に15%の凡例用余白を確保)
+            h=0.68,      # プロットエリアの高さ (下側に17%の横軸ラベル・タイトル用余白を確保)
+            xMode="edge",
+            yMode="edge"
+        )
+    )
+
+    # 月末残高と月内最低残高 (B列とC列)
+    data = Reference(ws, min_col=2, min_row=1, max_col=3, max_row=n_rows + 1)
+    # 対象年月 (A列)
+    cats = Reference(ws, min_col=1, min_row=2, max_row=n_rows + 1)
+
+    chart.add_data(data, titles_from_data=True)
+    chart.set_categories(cats)
+
+    # 軸の明示的表示（削除フラグをFalseに設定し、数値フォーマットを適用）
+    chart.y_axis.delete = False
+    chart.x_axis.delete = False
+    chart.y_axis.number_format = '#,##0'
+
+    # 凡例の位置調整：右上かつプロットエリア外に配置してグラフと重ねない
+    chart.legend.position = "tr"  # Top Right (右上)
+    chart.legend.overlay = False  # グラフエリアと重ねない
+
+    # 横軸ラベル（年月）が重なるのを防ぐために-45度斜め回転
+    chart.x_axis.txPr = RichText(
+        bodyPr=RichTextProperties(
+            rot="-2700000",  # -45度 (角度 * -60,000)
+            anchor="ctr",
+            anchorCtr="1",
+            spcFirstLastPara="1",
+            vertOverflow="ellipsis",
+            wrap="square"
+        )
+    )
+
+    # グラフの折れ線のデザイン変更 (青基調、直線的)
+    colors = ["1B365D", "4169E1"]
+    for i, color_hex in enumerate(colors):
+        if i < len(chart.series):
+            s = chart.series[i]
+            s.graphicalProperties.line.solidFill = color_hex
+            s.graphicalProperties.line.width = 25000  # 2.5pt
+            s.smooth = False
+    return chart
+
+
+def write_bank_workbook(sheets_info, bs_available: bool) -> bytes:
+    """(シート名, DataFrame, 列名) の並びを write-only のブックに行ごとに書き出し、xlsx のバイト列を返す。
+
+    write-only モードでは列幅・行の高さを行より先に決める必要があるため、値の変換と列幅の計算を
+    書き込み前に済ませる。スタイルは名前付きスタイルとして共有する。
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    styles = BankWorkbookStyles(wb)
+
+    for sheet_name, df_data, cols in sheets_info:
+        ws = wb.create_sheet(title=sheet_name)
+
+        # 1. 預金体力推移でB/Sデータがない場合
+        if sheet_name == "預金体力推移" and not bs_available:
+            ws.column_dimensions['B'].width = 80
+            note = WriteOnlyCell(ws, value="※貸借対照表（B/S）がアップロードされていないため、預金体力推移は算出できません。")
+            note.style = styles.note()
+            ws.append([])
+            ws.append([None, note])
+            continue
+
+        rows = [] if df_data.empty else [
+            [to_excel_value(val, col_name) for val, col_name in zip(row_data, cols)]
+            for row_data in df_data.values
+        ]
+        is_transfer_sheet = sheet_name == "資金移動用途推定"
+
+        # 列幅の設定
+        if is_transfer_sheet:
+            # 「資金移動用途推定」シートは自動調整を行わず、ファイル最上部で指定された固定幅を直接適用する
+            widths = [BANK_LIST_COLUMN_WIDTHS.get(col_name, 15) for col_name in cols]
+        else:
+            # その他のシートは自動スケーリング（改行考慮・全列合計最大200制限）を適用する
+            widths = auto_column_widths(cols, rows)
+        for col_idx, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+        # 長期未回収売掛シートでの行背景色（評価に基づく）
+        if sheet_name == "長期未回収売掛" and rows:
+            fill_keys = [
+                select_long_ar_fill_key(str(origin_val), str(eval_val))
+                for origin_val, eval_val in zip(df_data["発生原因"], df_data["評価"])
+            ]
+        else:
+            fill_keys = [None] * len(rows)
+
+        # ヘッダー書き込み
+        ws.row_dimensions[1].height = 28
+        header_style = styles.header()
+        header_cells = []
+        for col_name in cols:
+            cell = WriteOnlyCell(ws, value=col_name)
+            cell.style = header_style
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        # データ書き込み
+        if is_transfer_sheet:
+            idx_transfer = cols.index("資金移動仕訳")
+            idx_purpose = cols.index("用途推定仕訳")
+        for row_idx, (row, fill_key) in enumerate(zip(rows, fill_keys), 2):
+            row_height = 20
+            # 「資金移動用途推定」シートはセル内改行数に応じて行の高さを広げる
+            if is_transfer_sheet:
+                max_lines = max(str(row[idx_transfer][0]).count('\n'), str(row[idx_purpose][0]).count('\n')) + 1
+                row_height = max(20, max_lines * 16)  # 1行あたり16pt
+            ws.row_dimensions[row_idx].height = row_height
+
+            cells = []
+            for col_name, (value, kind) in zip(cols, row):
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = styles.cell(
+                    kind, fill_key,
+                    top=is_transfer_sheet,
+                    wrap=is_transfer_sheet and col_name in WRAPPED_TRANSFER_COLUMNS,
+                )
+                cells.append(cell)
+            ws.append(cells)
+
+        # 預金体力推移シートでの自動グラフ化（B/Sありの場合）
+        if sheet_name == "預金体力推移" and not df_data.empty:
+            ws.add_chart(build_balance_chart(ws, len(df_data)), "F2")
+
+    # bytes に変換
+    excel_io = io.BytesIO()
+    wb.save(excel_io)
+    return excel_io.getvalue()
+
+
+@dataclass(frozen=True)
+class BankSheets:
+    """銀行説明用リストの各シート（シート名, DataFrame, 列名）と、B/S の有無、シートごとの作成秒数。"""
+    sheets: list
+    bs_available: bool
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def to_excel(self) -> bytes:
+        return write_bank_workbook(self.sheets, self.bs_available)
+
+
 def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[bytes, Dict]:
     """
     銀行説明用リストのエクセルブック（全8シート）を作成する。
     また、売上計上思想指数の算出データを辞書形式で返す。
     """
-    # 1. 仕訳クレンジング
-    # 負額仕訳の借貸反転後は、標準化時の解決済み列を使い回さず一度だけ再解決する。
-    df_j = resolve_partner_columns(cleanse_journal(df_journal), force=True)
-    df_j['date'] = pd.to_datetime(df_j['date'], errors='coerce')
-    df_j = df_j.dropna(subset=['date']).sort_values('date')
-    
+    bank_sheets, sales_index_data = build_bank_sheets(df_journal, df_bs)
+    return bank_sheets.to_excel(), sales_index_data
+
+
+def _build_sales_index_sheets(df_j: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, Dict]:
+    """売上計上思想指数と、その該当仕訳・全売上仕訳のシート。"""
     # --- 指標14: 売上計上思想指数 ---
     is_sales_debit = df_j['debit_account'].str.contains('売上', na=False) & ~df_j['debit_account'].str.contains('雑収入', na=False)
     is_sales_credit = df_j['credit_account'].str.contains('売上', na=False) & ~df_j['credit_account'].str.contains('雑収入', na=False)
@@ -222,31 +513,39 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
         "total_count": total_sales_count
     }
     
-    # 1. 売上計上思想_該当仕訳
+    # 売上計上思想_該当仕訳
     df_sheet1 = df_sales_target.copy()
     # 金額は最大値を取得（クレンジングで正の数に変換済み）
     df_sheet1['amount'] = df_sheet1[['debit_amount', 'credit_amount']].max(axis=1)
     df_sheet1 = df_sheet1[['date', 'amount', 'description', 'debit_account', 'credit_account', 'credit_partner']].rename(columns={'description': '摘要', 'credit_partner': '貸方補助科目'})
     df_sheet1 = df_sheet1.sort_values('date')
     
-    # 2. 売上計上思想_全売上仕訳
+    # 売上計上思想_全売上仕訳
     df_sheet2 = df_sales.copy()
     df_sheet2['amount'] = df_sheet2[['debit_amount', 'credit_amount']].max(axis=1)
     df_sheet2 = df_sheet2[['date', 'amount', 'description', 'debit_account', 'credit_account', 'credit_partner']].rename(columns={'description': '摘要', 'credit_partner': '貸方補助科目'})
     df_sheet2 = df_sheet2.sort_values('date')
-    
+
+    return df_sheet1, df_sheet2, sales_index_data
+
+
+def _build_sales_receipt_sheet(df_j: pd.DataFrame) -> pd.DataFrame:
+    """売上入金シート。"""
     # --- 指標15: 売上入金・直入金売上リスト ---
     debit_pat = '預金|現金|受取手形|電信|当座|普通'
     credit_pat = '売掛|未収|買入金銭債権'
     
-    # 3. 売上入金
     df_nyukin = df_j[
         df_j['debit_account'].str.contains(debit_pat, na=False) &
         df_j['credit_account'].str.contains(credit_pat, na=False)
     ].copy()
     df_sheet3 = build_sales_receipt_list(df_nyukin, df_j)
-        
-    # 4. 直入金売上
+
+    return df_sheet3
+
+
+def _build_direct_sales_sheet(df_j: pd.DataFrame) -> pd.DataFrame:
+    """直入金売上シート。"""
     df_choku = build_direct_sales_details(df_j)
     df_sheet4 = pd.DataFrame()
     if not df_choku.empty:
@@ -257,7 +556,12 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
         df_sheet4['取引先'] = df_choku['partner']
         df_sheet4['取引先取得元'] = df_choku['source']
         df_sheet4 = df_sheet4.sort_values('日付')
-        
+
+    return df_sheet4
+
+
+def _build_direct_payment_sheet(df_j: pd.DataFrame, alias_index) -> pd.DataFrame:
+    """直払いリストシート。"""
     # --- 指標16: 直払いリスト ---
     exclude_pat = '買掛|未払|借入|利息|税|仮払|手数料'
     is_credit_yokin = df_j['credit_account'].str.contains('普通預金|当座預金', na=False)
@@ -283,8 +587,10 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
     
     df_sheet5 = pd.DataFrame()
     if not df_pay.empty:
-        df_pay['支払先'] = df_pay.apply(resolve_payment_partner_name, axis=1)
-        df_pay['支払先'] = consolidate_partner_aliases(df_pay['支払先']).fillna('取引先不明')
+        df_pay['支払先'] = resolve_payment_partner_names(df_pay)
+        df_pay['支払先'] = consolidate_partner_aliases(
+            df_pay['支払先'], alias_index=alias_index
+        ).fillna('取引先不明')
         df_sheet5['日付'] = df_pay['date']
         df_sheet5['金額'] = df_pay['credit_amount']
         df_sheet5['借方科目'] = df_pay['debit_account']
@@ -293,9 +599,13 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
         df_sheet5['支払先'] = df_pay['支払先']
         df_sheet5['カテゴリ'] = df_pay['category']
         df_sheet5 = df_sheet5.sort_values('日付')
-        
+
+    return df_sheet5
+
+
+def _build_cash_balance_sheet(df_j: pd.DataFrame, df_bs: pd.DataFrame, bs_available: bool) -> pd.DataFrame:
+    """預金体力推移シート。B/S（期末現預金合計）がない場合は空。"""
     # --- 指標17: 預金体力推移 ---
-    bs_available = (not df_bs.empty) and ("期末現預金合計" in df_bs.columns)
     df_sheet6 = pd.DataFrame()
     
     if bs_available:
@@ -303,60 +613,28 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
         
         # 現預金科目の増減計算
         # 借方に現預金科目がある場合はプラス、貸方にある場合はマイナス
-        cash_pat = '預金|現金|当座|普通'
-        df_j['debit_is_cash'] = df_j['debit_account'].str.contains(cash_pat, na=False)
-        df_j['credit_is_cash'] = df_j['credit_account'].str.contains(cash_pat, na=False)
-        
-        df_j['cash_diff'] = df_j.apply(
-            lambda r: (r['debit_amount'] if r['debit_is_cash'] else 0) - (r['credit_amount'] if r['credit_is_cash'] else 0),
-            axis=1
-        )
+        # （他シートと共有する仕訳には列を足さず、増減列を付けたコピーで計算する）
+        df_cash = df_j.assign(cash_diff=cash_movements(df_j))
         
         # 1年目・2年目の期首日に計上された開始／繰越仕訳だけを除外する。
         # 同じ取引Noの複合仕訳は、いずれかの行に開始／繰越表示があれば一括で除外する。
-        df_j = exclude_opening_cash_movements(df_j)
-        
-        # 日次で集計
-        df_daily = df_j.groupby('date')['cash_diff'].sum().reset_index()
-        
-        # 最終日から遡って残高を計算
-        df_daily = df_daily.sort_values('date', ascending=False).reset_index(drop=True)
-        daily_balances = []
-        current_bal = cash_balance_end
-        
-        for idx, row in df_daily.iterrows():
-            daily_balances.append({
-                "date": row['date'],
-                "balance": current_bal
-            })
-            current_bal -= row['cash_diff']
-            
-        df_bal = pd.DataFrame(daily_balances).sort_values('date').reset_index(drop=True)
-        
-        # 月次集計
-        df_bal['year_month'] = df_bal['date'].dt.to_period('M')
-        
-        monthly_data = []
-        for ym, group in df_bal.groupby('year_month'):
-            # 月末残高
-            end_bal = group.sort_values('date').iloc[-1]['balance']
-            # 月内最低残高
-            min_row = group.sort_values('balance').iloc[0]
-            min_bal = min_row['balance']
-            min_date = min_row['date']
-            
-            monthly_data.append({
-                "対象年月": ym.strftime("%y%m"),
-                "月末残高": int(end_bal),
-                "月内最低残高": int(min_bal),
-                "月内最低残高の記録日": min_date
-            })
-            
-        df_sheet6 = pd.DataFrame(monthly_data).sort_values("対象年月")
+        df_cash = exclude_opening_cash_movements(df_cash)
         
-    # 資金移動用途推定は、取引No単位・諸口展開・移動先口座追跡を行う専用ロジックで確定する。
-    df_sheet7 = build_capital_movement_list(df_j)
+        # 最終日の残高を期末現預金合計として、日次増減の累積和から各日の残高を逆算する
+        balances = daily_balances(df_cash['date'], df_cash['cash_diff'], cash_balance_end)
+        monthly = monthly_balance_summary(balances)
+        df_sheet6 = pd.DataFrame({
+            "対象年月": monthly["year_month"].dt.strftime("%y%m"),
+            "月末残高": monthly["end_balance"].astype(int),
+            "月内最低残高": monthly["min_balance"].astype(int),
+            "月内最低残高の記録日": monthly["min_date"],
+        }).sort_values("対象年月")
+
+    return df_sheet6
+
 
+def _build_long_ar_sheet(df_j: pd.DataFrame, alias_index) -> pd.DataFrame:
+    """長期未回収売掛シート。"""
     # --- 指標19: 長期未回収売掛リスト ---
     # 期間と期首日の算出
     min_date = df_j['date'].min()
@@ -378,8 +656,6 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
     
     clean_df = df_j[~is_year2_opening_debit].copy()
     
-    import re
-    
     def do_cleanse(val):
         if pd.isna(val):
             return ''
@@ -441,7 +717,7 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
         .dropna().astype(str)
     )
     clean_df['partner_clean'] = consolidate_partner_aliases(
-        clean_df['partner_clean'], protected_names=protected_individuals
+        clean_df['partner_clean'], protected_names=protected_individuals, alias_index=alias_index
     ).fillna('')
         
     # AR（売掛・未収）系科目の判定パターン
@@ -450,7 +726,6 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
     # 期首残高仕訳（真の期首日の借方売掛金/未収入金/買入金銭債権）
     is_opening = (clean_df['date'] == start_date) & clean_df['debit_account'].str.contains(ar_pattern, na=False)
     opening_df = clean_df[is_opening]
-    opening_bal = opening_df.groupby('partner_clean')['debit_amount'].sum().to_dict()
     
     # 借方・貸方それぞれのAR判定
     is_debit_ar = clean_df['debit_account'].str.contains(ar_pattern, na=False)
@@ -487,126 +762,134 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
     df_kai = clean_df[is_credit_ar & ~is_internal_ar_transfer].copy()
     
     base_date = clean_df['date'].max()
-    uncollected_items = []
-    debug_ar_list = []
-    
-    # 全取引先の一覧
-    all_partners = set(clean_df['partner_clean'].unique())
-    
-    for p in all_partners:
-        op = opening_bal.get(p, 0.0)
-        deb_sum = df_gen[df_gen['partner_clean'] == p]['debit_amount'].sum()
-        cred_sum = df_kai[df_kai['partner_clean'] == p]['credit_amount'].sum()
-        
-        # 逆算フォールバック：回収額が発生と期首を上回る場合は期首を補正
-        op_adj = max(op, cred_sum - deb_sum)
-        
-        # 期内残存売掛金残高（期末残高）
-        rem_bal = op_adj + deb_sum - cred_sum
-        
-        # デバッグ用レコードの追加
-        debug_ar_list.append({
-            "取引先(名寄せ後)": p,
-            "期首残高": op,
-            "期中発生(借方)": deb_sum,
-            "期中回収(貸方)": cred_sum,
-            "期首補正額": op_adj - op,
-            "期末残高": rem_bal
-        })
-        
-        if rem_bal <= 0:
-            continue
-            
-        # 発生仕訳（借方）を古い順（昇順）に整理する。
-        # まず、期首残高（補正後）を start_date (2023-09-01) の仮想的な発生レコードとしてリストの先頭に配置する。
-        p_gens_list = []
-        if op_adj > 0:
-            # 代表的な科目名を特定
-            p_gens_temp = clean_df[(clean_df['partner_clean'] == p) & is_debit_ar]
-            acc_name = p_gens_temp['debit_account'].iloc[0] if not p_gens_temp.empty else "売掛金"
-            p_gens_list.append({
-                "date": start_date,
-                "debit_amount": op_adj,
-                "debit_account": acc_name,
-                "ar_origin": "期首残高"
-            })
-            
-        # 次に、期中発生（期首日以外の借方仕訳）を古い順（昇順）に追加する
-        p_gen_mid = df_gen[df_gen['partner_clean'] == p].sort_values('date', ascending=True)
-        for _, row in p_gen_mid.iterrows():
-            p_gens_list.append({
-                "date": row['date'],
-                "debit_amount": row['debit_amount'],
-                "debit_account": row['debit_account'],
-                "ar_origin": row['ar_origin']
-            })
-            
-        # 回収の総額 `cred_sum` を用いて、古い発生から順次消し込む
-        remaining_cred = cred_sum
-        uncollected_gens = []
-        
-        for g in p_gens_list:
-            g_amt = g['debit_amount']
-            if remaining_cred >= g_amt:
-                # この発生は完全に回収された
-                remaining_cred -= g_amt
-            elif remaining_cred > 0:
-                # この発生は部分的に回収された
-                uncollected_amt = g_amt - remaining_cred
-                remaining_cred = 0.0
-                uncollected_gens.append({
-                    "date": g['date'],
-                    "amount": uncollected_amt,
-                    "debit_account": g['debit_account'],
-                    "ar_origin": g['ar_origin']
-                })
-            else:
-                # 回収原資が尽きているため、この発生は丸ごと未回収
-                uncollected_gens.append({
-                    "date": g['date'],
-                    "amount": g_amt,
-                    "debit_account": g['debit_account'],
-                    "ar_origin": g['ar_origin']
-                })
-                
-        # 未回収明細のうち、31日以上滞留しているものをリストアップする
-        for ug in uncollected_gens:
-            gen_date = ug['date']
-            amt = ug['amount']
-            if amt <= 0.01:
-                continue
-                
-            days = (base_date - gen_date).days
-            if days >= 31:
-                if days >= 91:
-                    eval_str = "🔴長期滞留"
-                elif days >= 61:
-                    eval_str = "🔶要整理"
-                else:
-                    eval_str = "⚠️注意"
-                    
-                uncollected_items.append({
-                    "発生日": gen_date,
-                    "滞留日数": days,
-                    "金額": amt,
-                    "取引先": p,
-                    "勘定科目": ug['debit_account'],
-                    "発生原因": ug['ar_origin'],
-                    "評価": eval_str
-                })
-                
-    df_sheet8 = pd.DataFrame(uncollected_items, columns=["発生日", "滞留日数", "金額", "取引先", "勘定科目", "発生原因", "評価"])
+
+    # 取引先ごとの期首残高・期中発生・期中回収を一括で集計する（取引先は名称順）。
+    partner_names = pd.Index(sorted(clean_df['partner_clean'].unique()))
+    opening_sums = opening_df.groupby('partner_clean')['debit_amount'].sum().reindex(partner_names, fill_value=0.0)
+    deb_sums = df_gen.groupby('partner_clean')['debit_amount'].sum().reindex(partner_names, fill_value=0.0)
+    cred_sums = df_kai.groupby('partner_clean')['credit_amount'].sum().reindex(partner_names, fill_value=0.0)
+
+    # 逆算フォールバック：回収額が発生と期首を上回る場合は期首を補正
+    op_adj = np.maximum(opening_sums, cred_sums - deb_sums)
+    # 期内残存売掛金残高（期末残高）
+    rem_bal = op_adj + deb_sums - cred_sums
+
+    # 期末残高が残る取引先について、発生を古い順に並べ回収総額で一括消込する。
+    # 期首残高（補正後）は start_date の仮想的な発生として各取引先の先頭に置き、
+    # 科目名はその取引先の最初の借方AR仕訳から取る。
+    outstanding = partner_names[(rem_bal > 0).to_numpy()]
+    with_opening = outstanding[(op_adj.loc[outstanding] > 0).to_numpy()]
+    first_ar_account = (
+        clean_df.loc[is_debit_ar].drop_duplicates('partner_clean').set_index('partner_clean')['debit_account']
+    )
+    opening_items = pd.DataFrame({
+        "partner": with_opening,
+        "date": start_date,
+        "debit_amount": op_adj.loc[with_opening].to_numpy(),
+        "debit_account": first_ar_account.reindex(with_opening).fillna("売掛金").to_numpy(),
+        "ar_origin": "期首残高",
+    })
+    # 次に、期中発生（期首日以外の借方仕訳）を古い順（昇順）に並べる
+    mid_items = (
+        df_gen.loc[df_gen['partner_clean'].isin(outstanding)]
+        .reindex(columns=['partner_clean', 'date', 'debit_amount', 'debit_account', 'ar_origin'])
+        .rename(columns={'partner_clean': 'partner'})
+    )
+    items = pd.concat([opening_items, mid_items], ignore_index=True)
+    partner_codes = outstanding.get_indexer(items['partner'])
+    is_mid = np.arange(len(items)) >= len(opening_items)
+    order = np.lexsort((items['date'].to_numpy(), is_mid, partner_codes))
+    items = items.iloc[order]
+
+    # 回収の総額を用いて、古い発生から順次消し込む
+    uncollected_amounts = settle_fifo_grouped(
+        partner_codes[order], items['debit_amount'].to_numpy(dtype=float), cred_sums.loc[outstanding].to_numpy()
+    )
+
+    # 未回収明細のうち、31日以上滞留しているものをリストアップする
+    days_list, buckets = aging_buckets(items['date'], base_date, AR_AGING_BOUNDS)
+    keep = (uncollected_amounts > 0.01) & (buckets >= 0)
+    df_sheet8 = pd.DataFrame({
+        "発生日": items['date'].to_numpy()[keep],
+        "滞留日数": days_list[keep].astype(int),
+        "金額": uncollected_amounts[keep],
+        "取引先": items['partner'].to_numpy()[keep],
+        "勘定科目": items['debit_account'].to_numpy()[keep],
+        "発生原因": items['ar_origin'].to_numpy()[keep],
+        "評価": np.array(AR_AGING_LABELS, dtype=object)[buckets[keep]],
+    }, columns=["発生日", "滞留日数", "金額", "取引先", "勘定科目", "発生原因", "評価"])
     if not df_sheet8.empty:
-        df_sheet8 = df_sheet8.sort_values("滞留日数", ascending=False)
-        
-    df_debug_ar = pd.DataFrame(debug_ar_list)
-    if not df_debug_ar.empty:
-        df_debug_ar = df_debug_ar.sort_values("期末残高", ascending=False)
-        
-    # --- Excelの出力・装飾 (openpyxl) ---
-    wb = openpyxl.Workbook()
-    # デフォルトのSheetを削除するため、まずはシート作成を行ってから最後に削除する
-    
+        df_sheet8 = df_sheet8.sort_values("滞留日数", ascending=False, kind="stable")
+
+    return df_sheet8
+
+
+def _run_sheet_tasks(tasks: Dict[str, Callable], max_workers: int) -> Tuple[Dict, Dict[str, float]]:
+    """シートの作成タスクを実行し、タスク名ごとの結果と所要秒数を返す。
+
+    max_workers が2以上ならスレッドで並列に実行する。タスクは共有の仕訳を読むだけで書き換えないこと。
+    """
+    def run(name):
+        started = time.perf_counter()
+        result = tasks[name]()
+        return result, time.perf_counter() - started
+
+    if max_workers > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bank-sheet") as executor:
+            outcomes = dict(zip(tasks, executor.map(run, tasks)))
+    else:
+        outcomes = {name: run(name) for name in tasks}
+    return {name: outcome[0] for name, outcome in outcomes.items()}, {name: outcome[1] for name, outcome in outcomes.items()}
+
+
+def build_bank_sheets(
+    df_journal: pd.DataFrame, df_bs: pd.DataFrame, max_workers: int = BANK_SHEET_WORKERS
+) -> Tuple[BankSheets, Dict]:
+    """
+    銀行説明用リスト（全8シート）の DataFrame を作成する。ブックへの書き出しは BankSheets.to_excel で行う。
+    また、売上計上思想指数の算出データを辞書形式で返す。
+    各シートはクレンジング済みの仕訳を共有して互いに独立に作れるため、max_workers 本のスレッドで並列に作る。
+    """
+    # 1. 仕訳クレンジング
+    # 負額仕訳の借貸反転後は、標準化時の解決済み列を使い回さず一度だけ再解決する。
+    started = time.perf_counter()
+    journal = ResolvedJournal.of(cleanse_journal(df_journal), force=True)
+    df_j = journal.frame.copy()
+    df_j['date'] = pd.to_datetime(df_j['date'], errors='coerce')
+    df_j = df_j.dropna(subset=['date']).sort_values('date')
+    # 名寄せ照合器は直払い・長期未回収売掛で共有するため、並列実行の前に作っておく
+    alias_index = journal.alias_index()
+    bs_available = (not df_bs.empty) and ("期末現預金合計" in df_bs.columns)
+    prepare_seconds = time.perf_counter() - started
+
+    # 2. シートごとの作成（時間のかかる資金移動用途推定・長期未回収売掛から着手する）
+    tasks = {
+        "資金移動用途推定": lambda: build_capital_movement_list(df_j),
+        "長期未回収売掛": lambda: _build_long_ar_sheet(df_j, alias_index),
+        "売上計上思想": lambda: _build_sales_index_sheets(df_j),
+        "売上入金": lambda: _build_sales_receipt_sheet(df_j),
+        "直入金売上": lambda: _build_direct_sales_sheet(df_j),
+        "直払いリスト": lambda: _build_direct_payment_sheet(df_j, alias_index),
+        "預金体力推移": lambda: _build_cash_balance_sheet(df_j, df_bs, bs_available),
+    }
+    started = time.perf_counter()
+    results, timings = _run_sheet_tasks(tasks, max_workers)
+    elapsed = time.perf_counter() - started
+    timings = {"仕訳クレンジング": prepare_seconds, **timings}
+    print(
+        f"--- DEBUG: 銀行説明用リストのシート作成 {elapsed:.2f}秒 (workers={max_workers})",
+        ", ".join(f"{name}={seconds:.2f}秒" for name, seconds in timings.items()),
+        "---",
+    )
+
+    df_sheet1, df_sheet2, sales_index_data = results["売上計上思想"]
+    df_sheet3 = results["売上入金"]
+    df_sheet4 = results["直入金売上"]
+    df_sheet5 = results["直払いリスト"]
+    df_sheet6 = results["預金体力推移"]
+    df_sheet7 = results["資金移動用途推定"]
+    df_sheet8 = results["長期未回収売掛"]
+
     sheets_info = [
         ("売上計上思想_該当仕訳", df_sheet1, ["日付", "金額", "摘要", "借方科目", "貸方科目", "貸方補助科目"]),
         ("売上計上思想_全売上仕訳", df_sheet2, ["日付", "金額", "摘要", "借方科目", "貸方科目", "貸方補助科目"]),
@@ -617,228 +900,5 @@ def create_bank_excel(df_journal: pd.DataFrame, df_bs: pd.DataFrame) -> Tuple[by
         ("資金移動用途推定", df_sheet7, ["資金移動日", "移動金額", "用途充当額", "金額差（未充当額）", "金額差率（未充当率）", "想定用途", "資金移動仕訳", "用途推定仕訳", "一致区分", "信頼度"]),
         ("長期未回収売掛", df_sheet8, ["発生日", "滞留日数", "金額", "取引先", "勘定科目", "発生原因", "評価"])
     ]
-    
-    # スタイル定義
-    FONT_NAME = "BIZ UDゴシック"
-    font_regular = Font(name=FONT_NAME, size=10)
-    font_bold = Font(name=FONT_NAME, size=10, bold=True)
-    font_header = Font(name=FONT_NAME, size=11, color="FFFFFF", bold=True)
-    
-    fill_header = PatternFill(start_color="1B365D", end_color="1B365D", fill_type="solid")
-    fill_red = PatternFill(start_color="FFE8E8", end_color="FFE8E8", fill_type="solid")
-    fill_orange = PatternFill(start_color="FFF3E0", end_color="FFF3E0", fill_type="solid")
-    fill_yellow = PatternFill(start_color="FFFDE7", end_color="FFFDE7", fill_type="solid")
-    fill_grey = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-    
-    align_center = Alignment(horizontal="center", vertical="center")
-    align_right = Alignment(horizontal="right", vertical="center")
-    align_left = Alignment(horizontal="left", vertical="center")
-    
-    border_thin = Side(border_style="thin", color="D3D3D3")
-    border_cell = Border(left=border_thin, right=border_thin, top=border_thin, bottom=border_thin)
-    
-    for sheet_name, df_data, cols in sheets_info:
-        ws = wb.create_sheet(title=sheet_name)
-        
-        # 1. 預金体力推移でB/Sデータがない場合
-        if sheet_name == "預金体力推移" and not bs_available:
-            ws.cell(row=2, column=2, value="※貸借対照表（B/S）がアップロードされていないため、預金体力推移は算出できません。").font = font_bold
-            ws.column_dimensions['B'].width = 80
-            continue
-            
-        # ヘッダー書き込み
-        ws.row_dimensions[1].height = 28
-        for col_idx, col_name in enumerate(cols, 1):
-            cell = ws.cell(row=1, column=col_idx, value=col_name)
-            cell.font = font_header
-            cell.fill = fill_header
-            cell.alignment = align_center
-            cell.border = border_cell
-            
-        # データ書き込み
-        if not df_data.empty:
-            for row_idx, row_data in enumerate(df_data.values, 2):
-                row_height = 20
-                
-                # 「資金移動用途推定」シートはセル内改行数に応じて行の高さを広げる
-                if sheet_name == "資金移動用途推定":
-                    idx_transfer = cols.index("資金移動仕訳")
-                    idx_purpose = cols.index("用途推定仕訳")
-                    val_transfer = str(row_data[idx_transfer]) if pd.notna(row_data[idx_transfer]) else ""
-                    val_purpose = str(row_data[idx_purpose]) if pd.notna(row_data[idx_purpose]) else ""
-                    lines_transfer = val_transfer.count('\n') + 1
-                    lines_purpose = val_purpose.count('\n') + 1
-                    max_lines = max(lines_transfer, lines_purpose)
-                    row_height = max(20, max_lines * 16) # 1行あたり16pt
-                    
-                ws.row_dimensions[row_idx].height = row_height
-                
-                for col_idx, val in enumerate(row_data, 1):
-                    cell = ws.cell(row=row_idx, column=col_idx)
-                    cell.font = font_regular
-                    cell.border = border_cell
-                    
-                    # 型に応じたフォーマットと配置
-                    if isinstance(val, pd.Timestamp):
-                        cell.value = val.strftime('%Y-%m-%d')
-                        cell.alignment = align_center
-                    elif isinstance(val, (int, float, np.integer, np.floating)):
-                        cell.value = val
-                        col_name = cols[col_idx-1]
-                        if col_name == "金額差率（未充当率）":
-                            cell.number_format = "0.0%"
-                            cell.alignment = align_right
-                        elif "金額" in col_name or col_name == "月末残高" or col_name == "月内最低残高":
-                            cell.number_format = "#,##0"
-                            cell.alignment = align_right
-                        elif col_name == "滞留日数":
-                            cell.number_format = "#,##0"
-                            cell.alignment = align_right
-                        else:
-                            cell.alignment = align_left
-                    else:
-                        cell.value = str(val) if pd.notna(val) else ""
-                        cell.alignment = align_left
-                        
-                    # 資金移動用途推定シートの折り返し・縦位置上揃え設定
-                    if sheet_name == "資金移動用途推定":
-                        col_name = cols[col_idx-1]
-                        if col_name in ["資金移動日", "資金移動仕訳", "用途推定仕訳"]:
-                            cell.alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
-                        else:
-                            curr_align = cell.alignment
-                            cell.alignment = Alignment(
-                                horizontal=curr_align.horizontal if curr_align else "left",
-                                vertical="top"
-                            )
-                        
-                # 長期未回収売掛シートでの行背景色（評価に基づく）
-                if sheet_name == "長期未回収売掛":
-                    eval_val = str(row_data[cols.index("評価")]) if "評価" in cols else ""
-                    origin_val = str(row_data[cols.index("発生原因")]) if "発生原因" in cols else ""
-                    fill_to_apply = {
-                        "grey": fill_grey,
-                        "red": fill_red,
-                        "orange": fill_orange,
-                        "yellow": fill_yellow,
-                    }.get(select_long_ar_fill_key(origin_val, eval_val))
-                        
-                    if fill_to_apply:
-                        for cell in ws[row_idx]:
-                            cell.fill = fill_to_apply
-                            
-        # 預金体力推移シートでの自動グラフ化（B/Sありの場合）
-        if sheet_name == "預金体力推移" and bs_available and not df_sheet6.empty:
-            chart = LineChart()
-            chart.title = "預金体力推移（縦軸は「残高(円)」、横軸は「対象年月」）"
-            chart.style = 10
-            
-            # グラフのサイズをやや広げて視認性と余白を確保
-            chart.width = 20
-            chart.height = 13
-            
-            # プロットエリア自体のレイアウトを設定して、上下左右に白い余白を確保
-            # これにより、タイトル、軸タイトル、軸数値、凡例がグラフ線や枠線と被るのを防ぎます
-            chart.plot_area.layout = Layout(
-                manualLayout=ManualLayout(
-                    x=0.15,      # 左余白 (全体を1.0とした割合、左から15%の位置から開始)
-                    y=0.15,      # 上余白 (上から15%の位置から開始)
-                    w=0.70,      # プロットエリアの幅 (右側に15%の凡例用余白を確保)
-                    h=0.68,      # プロットエリアの高さ (下側に17%の横軸ラベル・タイトル用余白を確保)
-                    xMode="edge",
-                    yMode="edge"
-                )
-            )
-            
-            # 月末残高と月内最低残高 (B列とC列)
-            data = Reference(ws, min_col=2, min_row=1, max_col=3, max_row=len(df_sheet6)+1)
-            # 対象年月 (A列)
-            cats = Reference(ws, min_col=1, min_row=2, max_row=len(df_sheet6)+1)
-            
-            chart.add_data(data, titles_from_data=True)
-            chart.set_categories(cats)
-            
-            # 軸の明示的表示（削除フラグをFalseに設定し、数値フォーマットを適用）
-            chart.y_axis.delete = False
-            chart.x_axis.delete = False
-            chart.y_axis.number_format = '#,##0'
-            
-            # 凡例の位置調整：右上かつプロットエリア外に配置してグラフと重ねない
-            chart.legend.position = "tr"  # Top Right (右上)
-            chart.legend.overlay = False  # グラフエリアと重ねない
-            
-            # 横軸ラベル（年月）が重なるのを防ぐために-45度斜め回転
-            from openpyxl.chart.text import RichText
-            from openpyxl.drawing.text import RichTextProperties
-            chart.x_axis.txPr = RichText(
-                bodyPr=RichTextProperties(
-                    rot="-2700000",  # -45度 (角度 * -60,000)
-                    anchor="ctr",
-                    anchorCtr="1",
-                    spcFirstLastPara="1",
-                    vertOverflow="ellipsis",
-                    wrap="square"
-                )
-            )
-            
-            # グラフの折れ線のデザイン変更 (青基調、直線的)
-            colors = ["1B365D", "4169E1"]
-            for i, color_hex in enumerate(colors):
-                if i < len(chart.series):
-                    s = chart.series[i]
-                    s.graphicalProperties.line.solidFill = color_hex
-                    s.graphicalProperties.line.width = 25000  # 2.5pt
-                    s.smooth = False
-            
-            # グラフの配置
-            ws.add_chart(chart, "F2")
-            
-        # 列幅の設定
-        if sheet_name == "資金移動用途推定":
-            # 「資金移動用途推定」シートは自動調整を行わず、ファイル最上部で指定された固定幅を直接適用する
-            for col_idx, col_name in enumerate(cols, 1):
-                col_letter = get_column_letter(col_idx)
-                width = BANK_LIST_COLUMN_WIDTHS.get(col_name, 15)
-                ws.column_dimensions[col_letter].width = width
-        else:
-            # その他のシートは従来どおり自動スケーリング（改行考慮・全列合計最大200制限）を適用する
-            col_widths = {}
-            total_width = 0
-            for col in ws.columns:
-                max_len = 0
-                col_letter = get_column_letter(col[0].column)
-                for cell in col:
-                    val_str = str(cell.value or '')
-                    # 改行で分割し、各行の中での最大長を測定する
-                    lines = val_str.split('\n')
-                    for line in lines:
-                        length = sum(2 if ord(c) > 127 else 1 for c in line)
-                        if length > max_len:
-                            max_len = length
-                
-                # 推奨幅（文字数 + バッファ）
-                recommended_width = max(max_len + 4, 12)
-                col_widths[col_letter] = recommended_width
-                total_width += recommended_width
-                
-            # 全列合計の列幅を最大200に制限するスケーリング調整
-            MAX_TOTAL_WIDTH = 200
-            if total_width > MAX_TOTAL_WIDTH:
-                scale_factor = MAX_TOTAL_WIDTH / total_width
-                for col_letter, w in col_widths.items():
-                    col_widths[col_letter] = max(w * scale_factor, 8) # 最小幅は8を維持
-                    
-            # 列幅の適用
-            for col_letter, w in col_widths.items():
-                ws.column_dimensions[col_letter].width = w
-            
-    # デフォルトのSheetを削除
-    if "Sheet" in wb.sheetnames:
-        wb.remove(wb["Sheet"])
-        
-    # bytes に変換
-    excel_io = io.BytesIO()
-    wb.save(excel_io)
-    excel_bytes = excel_io.getvalue()
-    
-    return excel_bytes, sales_index_data
+
+    return BankSheets(sheets_info, bs_available, timings), sales_index_data
@@ -0,0 +1,94 @@
+"""取引先×月の疎な活動キューブ。取引先別の指標は明細を都度走査せず、このキューブへの問い合わせで求める。"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+from process.transaction_details import UNKNOWN_PARTNER
+
+
+# 取引Noとして扱わない値。イベントの識別では日付で代用する。
+MISSING_TRANSACTION_VALUES = ["", "nan", "none", "null", "<NA>"]
+
+
+def _event_keys(events: pd.DataFrame, dates: pd.Series) -> pd.Series:
+    """複合仕訳の複数行を1取引に数えるための取引識別子。取引Noが無い行は日付で代用する。"""
+    keys = events["transaction_no"].astype("string")
+    missing = keys.isna() | keys.str.strip().isin(MISSING_TRANSACTION_VALUES)
+    return keys.mask(missing, "NO_TX_" + dates.astype(str))
+
+
+class PartnerActivityCube:
+    """明細・イベントを取引先（整数ID）×月のセルへ集約したもの。
+
+    cells は値のあるセルだけを持つ疎な表（partner_id, month[, category], amount, events）。
+    取引先ごとの初回・2回目のイベント日は、取引先×日付×取引Noで1件に数えたイベントから求める。
+    """
+
+    def __init__(self, events: pd.DataFrame, category_column: str | None = None):
+        codes, partners = pd.factorize(events["partner"], use_na_sentinel=True)
+        self.partners = pd.Index(partners)
+        dates = pd.to_datetime(events["date"], errors="coerce")
+        frame = pd.DataFrame({
+            "partner_id": codes,
+            "date": dates.to_numpy(),
+            "month": dates.dt.to_period("M").to_numpy(),
+            "amount": pd.to_numeric(events["amount"], errors="coerce").fillna(0.0).to_numpy(),
+        })
+        keys = ["partner_id", "month"]
+        if category_column is not None:
+            frame["category"] = events[category_column].to_numpy()
+            keys.append("category")
+        frame = frame[frame["partner_id"] >= 0]
+        frame["event"] = frame.groupby(
+            ["partner_id", "date", _event_keys(events, dates).to_numpy()[frame.index]], dropna=False, sort=False
+        ).ngroup().to_numpy()
+
+        self.cells = frame.groupby(keys, dropna=False, sort=True).agg(
+            amount=("amount", "sum"), events=("event", "nunique")
+        ).reset_index()
+
+        # 日付の無い明細は金額には含めるが、イベント日の判定には使わない。
+        dated = frame.dropna(subset=["date"])
+        timeline = dated.drop_duplicates("event").sort_values(["partner_id", "date"], kind="stable").groupby("partner_id")
+        partner_ids = pd.RangeIndex(len(self.partners), name="partner_id")
+        self.first_dates = timeline.nth(0).set_index("partner_id")["date"].reindex(partner_ids)
+        self.second_dates = timeline.nth(1).set_index("partner_id")["date"].reindex(partner_ids)
+        self.category_first_dates = (
+            dated.groupby(["category", "partner_id"])["date"].min() if category_column is not None else None
+        )
+
+    @property
+    def empty(self) -> bool:
+        return len(self.partners) == 0
+
+    def partner_totals(self) -> pd.Series:
+        """取引先名ごとの金額合計。"""
+        totals = self.cells.groupby("partner_id")["amount"].sum()
+        return pd.Series(totals.to_numpy(), index=self.partners[totals.index], name="amount")
+
+    def top_share(self, count: int = 3) -> float | None:
+        """不明額は分母だけに含め、判明先の上位 count 社を分子にした集中度（%）。"""
+        if self.empty:
+            return None
+        amounts = self.partner_totals().sort_values(ascending=False)
+        denominator = amounts.sum()
+        if denominator <= 0:
+            return None
+        numerator = amounts.drop(index=UNKNOWN_PARTNER, errors="ignore").head(count).sum()
+        return float(numerator / denominator * 100)
+
+    def partners_first_seen_after(self, boundary) -> set:
+        """boundary より後に初めてイベントが現れた取引先名。"""
+        return set(self.partners[self.first_dates.index[self.first_dates > boundary]])
+
+    def repeated_within(self, days: int) -> pd.Series:
+        """取引先名ごとに、2回目のイベントが初回から days 日以内にあるか。"""
+        gaps = (self.second_dates - self.first_dates).dt.days
+        return pd.Series((gaps <= days).to_numpy(), index=self.partners, name="repeated")
+
+    def partner_count_until(self, boundary, category) -> int:
+        """boundary 以前に category のイベントがある取引先の数。"""
+        if self.category_first_dates is None or category not in self.category_first_dates.index.get_level_values(0):
+            return 0
+        return int((self.category_first_dates.loc[category] <= boundary).sum())
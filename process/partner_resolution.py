@@ -1,6 +1,7 @@
 import re
 import unicodedata
 
+import numpy as np
 import pandas as pd
 
 
@@ -9,6 +10,8 @@ SALES_ACCOUNT_PATTERN = r"売上"
 PURCHASE_ACCOUNT_PATTERN = r"仕入|売上原価|外注"
 AR_ACCOUNT_PATTERN = r"売掛|未収|買入金銭債権"
 AP_ACCOUNT_PATTERN = r"買掛|未払"
+# 既知先名がこの文字数未満なら、銀行摘要の末尾ではなく摘要全体と一致する場合だけ採用する（誤一致防止）
+MIN_SUFFIX_PARTNER_LENGTH = 3
 GENERIC_PARTNER_NAMES = {"諸口", "摘要", "取引先", "不明", "なし", "空欄"}
 CORPORATE_MARKER_PATTERN = (
     r"株式会社|有限会社|合資会社|合名会社|合同会社|医療法人|社会福祉法人|"
@@ -23,6 +26,25 @@ BANK_DESCRIPTION_PATTERN = (
     r"ミツビシ|ミツイスミトモ|エスビーアイ|ユウチョ|ラクテン|"
     r"ヨコハマ|エヒメシンキン|GMO|振込|フリコミ|ﾌﾘｺﾐ"
 )
+# 銀行摘要の照合・分解は全現預金行で走るため、正規表現は読み込み時に一度だけコンパイルする。
+_TRANSFER_PREFIX_RE = re.compile(r"^(?:振込|フリコミ|振込口|ネット)")
+_CORPORATE_NAME_RE = re.compile(
+    r"株式会社|有限会社|合資会社|合名会社|合同会社|法人|"
+    r"\(株\)|（株）|\(有\)|（有）|\(合\)|（合）|㈱|㈲|"
+    r"\(カ\)|（カ）|カ\)|\(カ|（カ|カ）|\(ユ\)|（ユ）|ユ\)|\(ユ|（ユ|ユ）|"
+    r"カブシキガイシャ|ユウゲンガイシャ|ゴウドウガイシャ"
+)
+_WHITESPACE_RE = re.compile(r"[\s　]+")
+_EDGE_SYMBOL_RE = re.compile(r"^[.\-_ー]+|[.\-_ー]+$")
+_CORPORATE_MARKER_RE = re.compile(CORPORATE_MARKER_PATTERN, flags=re.IGNORECASE)
+_BANK_DESCRIPTION_RE = re.compile(BANK_DESCRIPTION_PATTERN, flags=re.IGNORECASE)
+_BANK_MEMO_SPLIT_RE = re.compile(r"\((?:依頼人名|振込予定|管理番号)|（(?:依頼人名|振込予定|管理番号)")
+_TRANSFER_TOKEN_RE = re.compile(r"振込|フリコミ|ﾌﾘｺﾐ")
+_ACCOUNT_CONTEXT_RE = re.compile(r"営業部|支店|出張所|普通預金|当座預金|貯蓄預金")
+_ACCOUNT_NUMBER_RE = re.compile(r"\d{5,}")
+_REPRESENTATIVE_RE = re.compile(r"代表|ダイヒョウ|ダイヒヨウ")
+# 逆順トライで終端ノードに置く (既知先名, 種別) のキー。文字と衝突しないよう空文字にする。
+_TRIE_TERMINAL = ""
 RESOLVED_PARTNER_COLUMNS = tuple(
     f"{name}_partner{suffix}"
     for name in ("sales", "purchase", "ar", "payment")
@@ -43,16 +65,10 @@ def normalize_partner_name(value):
     if pd.isna(value):
         return pd.NA
     text = str(value)
-    text = re.sub(r"^(?:振込|フリコミ|振込口|ネット)", "", text)
-    corporate_patterns = (
-        r"株式会社|有限会社|合資会社|合名会社|合同会社|法人|"
-        r"\(株\)|（株）|\(有\)|（有）|\(合\)|（合）|㈱|㈲|"
-        r"\(カ\)|（カ）|カ\)|\(カ|（カ|カ）|\(ユ\)|（ユ）|ユ\)|\(ユ|（ユ|ユ）|"
-        r"カブシキガイシャ|ユウゲンガイシャ|ゴウドウガイシャ"
-    )
-    text = re.sub(corporate_patterns, "", text)
-    text = re.sub(r"[\s　]+", "", text)
-    text = re.sub(r"^[.\-_ー]+|[.\-_ー]+$", "", text)
+    text = _TRANSFER_PREFIX_RE.sub("", text)
+    text = _CORPORATE_NAME_RE.sub("", text)
+    text = _WHITESPACE_RE.sub("", text)
+    text = _EDGE_SYMBOL_RE.sub("", text)
     if text.lower() in GENERIC_PARTNER_NAMES:
         return pd.NA
     return text if text else pd.NA
@@ -66,37 +82,72 @@ def _contains(value, pattern: str) -> bool:
     return bool(re.search(pattern, _text(value)))
 
 
-def _valid_candidate(value, account, reject_cash=False):
-    if pd.isna(value) or not str(value).strip():
-        return None
-    if reject_cash and _contains(account, CASH_ACCOUNT_PATTERN):
-        return None
-    return normalize_partner_name(value)
-
-
-def _first_candidate(candidates, fallback_source=""):
-    for value, source in candidates:
-        if value is not None and not pd.isna(value) and str(value).strip():
-            return value, source
-    return pd.NA, fallback_source
-
-
-def _unique_group_candidate(group: pd.DataFrame, conditions):
-    candidates = []
-    for mask_col, column, source in conditions:
-        for value in group.loc[group[mask_col], column].dropna():
-            normalized = normalize_partner_name(value)
-            if pd.notna(normalized) and normalized not in candidates:
-                candidates.append(normalized)
-    if len(candidates) == 1:
-        return candidates[0], source
-    return pd.NA, ""
+def map_unique(series: pd.Series, func) -> np.ndarray:
+    """同じ値が多い列で、func を一意値ごとに1回だけ評価して各行へ展開する。"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    # 欠損値の結果は末尾に置き、na_sentinel(-1) の参照先にする。
+    mapped = np.empty(len(uniques) + 1, dtype=object)
+    for position, value in enumerate(uniques):
+        mapped[position] = func(value)
+    mapped[-1] = func(pd.NA)
+    return mapped[codes]
+
+
+def _contains_mask(series: pd.Series, pattern: str) -> np.ndarray:
+    return map_unique(series, lambda value: _contains(value, pattern)).astype(bool)
+
+
+def _first_candidate_columns(candidates, default_mask):
+    """_first_candidate の列版。(値配列, 取得元) を優先順に並べ、default_mask の行だけ埋める。"""
+    size = len(default_mask)
+    values = np.full(size, pd.NA, dtype=object)
+    sources = np.full(size, "", dtype=object)
+    pending = np.asarray(default_mask, dtype=bool).copy()
+    for candidate, source in candidates:
+        hit = pending & pd.notna(candidate)
+        values[hit] = candidate[hit]
+        sources[hit] = source[hit] if isinstance(source, np.ndarray) else source
+        pending &= ~hit
+    return values, sources
+
+
+def _select_candidates(branches):
+    """if/elif の分岐ごとに優先順位付き候補を評価する。どの分岐にも当たらない行は (NA, "")。"""
+    size = len(branches[0][0])
+    values = np.full(size, pd.NA, dtype=object)
+    sources = np.full(size, "", dtype=object)
+    remaining = np.ones(size, dtype=bool)
+    for mask, candidates in branches:
+        selected = remaining & mask
+        branch_values, branch_sources = _first_candidate_columns(candidates, selected)
+        values[selected] = branch_values[selected]
+        sources[selected] = branch_sources[selected]
+        remaining &= ~selected
+    return values, sources
+
+
+def _transaction_unique_candidate(transaction_no: pd.Series, compound: np.ndarray, conditions) -> np.ndarray:
+    """複数行取引ごとに、条件行の取引先（正規化済み）が1種類に定まる場合だけその値を全行へ展開する。"""
+    frames = []
+    for mask, values in conditions:
+        selected = compound & mask & pd.notna(values)
+        frames.append(pd.DataFrame({"tx": transaction_no[selected], "value": values[selected]}))
+    filled = np.full(len(transaction_no), pd.NA, dtype=object)
+    stacked = pd.concat(frames, ignore_index=True)
+    if stacked.empty:
+        return filled
+    stats = stacked.groupby("tx", sort=False)["value"].agg(["nunique", "first"])
+    unique = stats.loc[stats["nunique"] == 1, "first"]
+    mapped = transaction_no.map(unique).to_numpy(dtype=object)
+    hit = compound & pd.notna(mapped)
+    filled[hit] = mapped[hit]
+    return filled
 
 
 def _party_kind(raw_value) -> str:
     """法人表記が明示されたものだけ法人確定とし、それ以外は不明扱いにする。"""
     raw = normalize_description(raw_value)
-    if pd.notna(raw) and re.search(CORPORATE_MARKER_PATTERN, str(raw), flags=re.IGNORECASE):
+    if pd.notna(raw) and _CORPORATE_MARKER_RE.search(str(raw)):
         return "corporate"
     return "unknown"
 
@@ -114,7 +165,7 @@ def _known_partner_catalog(result: pd.DataFrame) -> dict[str, str]:
     for column in ("description_raw", "description", "partner_raw"):
         if column not in result.columns:
             continue
-        for raw in result[column].dropna():
+        for raw in result[column].dropna().drop_duplicates():
             if _party_kind(raw) == "corporate":
                 normalized = normalize_partner_name(raw)
                 if pd.notna(normalized):
@@ -122,9 +173,10 @@ def _known_partner_catalog(result: pd.DataFrame) -> dict[str, str]:
     for mask, column in conditions:
         raw_column = f"{column}_raw" if f"{column}_raw" in result.columns else column
         selected = result.loc[mask & result[column].notna()]
-        for raw in selected[raw_column]:
+        # 種別は「一度でも法人なら法人」で決まり出現順に依らないため、同じ生値は1回だけ見る。
+        for raw in selected[raw_column].drop_duplicates():
             normalized = normalize_partner_name(raw)
-            if pd.isna(normalized) or len(str(normalized)) < 3:
+            if pd.isna(normalized) or len(str(normalized)) < MIN_SUFFIX_PARTNER_LENGTH:
                 continue
             kind = "corporate" if str(normalized) in corporate_names else _party_kind(raw)
             previous = catalog.get(str(normalized))
@@ -143,38 +195,53 @@ def _known_partner_catalog(result: pd.DataFrame) -> dict[str, str]:
     return catalog
 
 
-def _bank_partner_suffix_index(catalog: dict[str, str]) -> dict[str, list[tuple[str, str]]]:
-    index = {}
-    for known, kind in catalog.items():
-        index.setdefault(known[-3:], []).append((known, kind))
-    for values in index.values():
-        values.sort(key=lambda item: len(item[0]), reverse=True)
-    return index
-
+def _bank_partner_suffix_trie(catalog: dict[str, str]) -> dict:
+    """既知先名を逆順に格納したトライ。摘要を末尾から1回なぞるだけで、末尾一致する既知先を全て拾える。
 
-def _extract_known_partner_from_bank_description(value, suffix_index):
+    MIN_SUFFIX_PARTNER_LENGTH 未満の既知先は、摘要全体と一致する場合だけ拾うよう印を付けておく。
+    """
+    trie = {}
+    for known, kind in catalog.items():
+        node = trie
+        for char in reversed(known):
+            node = node.setdefault(char, {})
+        node[_TRIE_TERMINAL] = (known, kind, len(known) >= MIN_SUFFIX_PARTNER_LENGTH)
+    return trie
+
+
+def _match_known_suffixes(text: str, suffix_trie: dict):
+    """text の末尾に一致する既知先を、短い順に (既知先名, 種別, 残りの先頭部分) で返す。
+
+    短い既知先は text 全体と一致する場合だけ返す。
+    """
+    node = suffix_trie
+    length = len(text)
+    for position in range(length - 1, -1, -1):
+        node = node.get(text[position])
+        if node is None:
+            return
+        if _TRIE_TERMINAL in node:
+            known, kind, suffix_match = node[_TRIE_TERMINAL]
+            if suffix_match or position == 0:
+                yield known, kind, text[:position]
+
+
+def _extract_known_partner_from_bank_description(value, suffix_trie):
     """銀行情報付き摘要の末尾を既知先と完全照合する。推測だけでは置換しない。"""
     raw = normalize_description(value)
     normalized = normalize_partner_name(raw)
     if pd.isna(normalized):
         return normalized, "摘要", "unknown"
-    if not suffix_index:
+    if not suffix_trie:
         return _extract_structured_bank_counterparty(raw, normalized)
-    text = str(normalized)
-    matches = []
-    for known, kind in suffix_index.get(text[-3:], ()):
-        if text == known:
-            matches.append((known, kind, ""))
-        elif text.endswith(known):
-            matches.append((known, kind, text[:-len(known)]))
-    matches = [item for item in matches if not item[2] or re.search(BANK_DESCRIPTION_PATTERN, item[2], flags=re.IGNORECASE)]
-    if not matches:
+    # 既知先名は互いに異なるため、末尾一致のうち最長で条件を満たすものが唯一の採用候補になる。
+    winner = None
+    for known, kind, prefix in _match_known_suffixes(str(normalized), suffix_trie):
+        if not prefix or _BANK_DESCRIPTION_RE.search(prefix):
+            winner = (known, kind, prefix)
+    if winner is None:
         return _extract_structured_bank_counterparty(raw, normalized)
-    longest = max(len(item[0]) for item in matches)
-    winners = [item for item in matches if len(item[0]) == longest]
-    if len(winners) != 1:
-        return normalized, "摘要", "unknown"
-    known, kind, prefix = winners[0]
+    known, kind, prefix = winner
     if not prefix:
         return known, "摘要（既知取引先完全一致）", kind
     resolved_kind = kind if kind == "corporate" else "individual"
@@ -186,21 +253,21 @@ def _extract_structured_bank_counterparty(raw, normalized):
     if pd.isna(raw):
         return normalized, "摘要", "unknown"
     text = unicodedata.normalize("NFKC", str(raw)).strip()
-    head = re.split(r"\((?:依頼人名|振込予定|管理番号)|（(?:依頼人名|振込予定|管理番号)", text, maxsplit=1)[0]
-    tokens = [token for token in re.split(r"[\s　]+", head) if token]
-    is_transfer_description = bool(tokens and re.fullmatch(r"振込|フリコミ|ﾌﾘｺﾐ", tokens[0]))
+    head = _BANK_MEMO_SPLIT_RE.split(text, maxsplit=1)[0]
+    tokens = [token for token in _WHITESPACE_RE.split(head) if token]
+    is_transfer_description = bool(tokens and _TRANSFER_TOKEN_RE.fullmatch(tokens[0]))
     candidates = []
     removed_bank_context = False
     has_account_context = False
     for token in tokens:
-        if re.search(BANK_DESCRIPTION_PATTERN, token, flags=re.IGNORECASE):
+        if _BANK_DESCRIPTION_RE.search(token):
             removed_bank_context = True
             continue
-        if re.search(r"営業部|支店|出張所|普通預金|当座預金|貯蓄預金", token):
+        if _ACCOUNT_CONTEXT_RE.search(token):
             removed_bank_context = True
             has_account_context = True
             continue
-        if re.fullmatch(r"\d{5,}", token):
+        if _ACCOUNT_NUMBER_RE.fullmatch(token):
             removed_bank_context = True
             has_account_context = True
             continue
@@ -208,7 +275,7 @@ def _extract_structured_bank_counterparty(raw, normalized):
     if not removed_bank_context or not candidates:
         return normalized, "摘要", "unknown"
     is_corporate = _party_kind(head) == "corporate"
-    has_representative_label = bool(re.search(r"代表|ダイヒョウ|ダイヒヨウ", head))
+    has_representative_label = bool(_REPRESENTATIVE_RE.search(head))
     # 個人の銀行摘要は「銀行略称 姓 名」になりやすい。構造語を除去した後に
     # 3トークン以上残る場合だけ、末尾の姓・名を採用する。
     if len(candidates) >= 3 and not is_corporate and not has_representative_label:
@@ -237,102 +304,100 @@ def resolve_partner_columns(df: pd.DataFrame, force: bool = False) -> pd.DataFra
         result["description"] = result["partner"]
     result["description"] = result["description"].apply(normalize_description)
     known_catalog = _known_partner_catalog(result)
-    bank_suffix_index = _bank_partner_suffix_index(known_catalog)
-
-    resolved_rows = []
-    # Seriesを行ごとに生成するiterrowsは大規模元帳で重いため、辞書レコードを使う。
-    for row in result.to_dict("records"):
-        debit_account = row.get("debit_account")
-        credit_account = row.get("credit_account")
-        debit_partner = _valid_candidate(row.get("debit_partner"), debit_account, reject_cash=True)
-        credit_partner = _valid_candidate(row.get("credit_partner"), credit_account, reject_cash=True)
-        description_partner = normalize_partner_name(row.get("description"))
-        description_source = "摘要"
-        description_kind = _party_kind(row.get("description"))
-        is_bank_entry = _contains(debit_account, CASH_ACCOUNT_PATTERN) or _contains(credit_account, CASH_ACCOUNT_PATTERN)
-        if is_bank_entry:
-            description_partner, description_source, description_kind = _extract_known_partner_from_bank_description(
-                row.get("description"), bank_suffix_index
-            )
-        legacy_partner = normalize_partner_name(row.get("partner"))
-
-        if _contains(debit_account, AR_ACCOUNT_PATTERN):
-            ar = _first_candidate(((debit_partner, "借方AR補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        elif _contains(credit_account, AR_ACCOUNT_PATTERN):
-            ar = _first_candidate(((credit_partner, "貸方AR補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        else:
-            ar = (pd.NA, "")
-
-        if _contains(credit_account, SALES_ACCOUNT_PATTERN):
-            sales = _first_candidate(((debit_partner, "売上相手側補助科目"), (credit_partner, "売上側補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        elif _contains(debit_account, SALES_ACCOUNT_PATTERN):
-            sales = _first_candidate(((credit_partner, "売上相手側補助科目"), (debit_partner, "売上側補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        else:
-            sales = (pd.NA, "")
-
-        if _contains(debit_account, PURCHASE_ACCOUNT_PATTERN):
-            purchase = _first_candidate(((credit_partner, "仕入相手側補助科目"), (debit_partner, "仕入側補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        elif _contains(credit_account, PURCHASE_ACCOUNT_PATTERN):
-            purchase = _first_candidate(((debit_partner, "仕入相手側補助科目"), (credit_partner, "仕入側補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        else:
-            purchase = (pd.NA, "")
-
-        if _contains(credit_account, CASH_ACCOUNT_PATTERN):
-            payment = _first_candidate(((debit_partner, "支払先側補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        elif _contains(debit_account, CASH_ACCOUNT_PATTERN):
-            payment = _first_candidate(((credit_partner, "入金元側補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-        else:
-            payment = _first_candidate(((debit_partner, "借方補助科目"), (credit_partner, "貸方補助科目"), (description_partner, description_source), (legacy_partner, "互換partner")))
-
-        resolved_rows.append((sales, purchase, ar, payment, description_kind))
-
-    for index, name in enumerate(("sales", "purchase", "ar", "payment")):
-        result[f"{name}_partner"] = [row[index][0] for row in resolved_rows]
-        result[f"{name}_partner_source"] = [row[index][1] for row in resolved_rows]
-        result[f"{name}_partner_kind"] = [
-            row[4] if row[index][1].startswith(("摘要", "銀行摘要")) else "unknown"
-            for row in resolved_rows
-        ]
-
-    valid_tx = result["transaction_no"].notna() & ~result["transaction_no"].astype(str).str.lower().isin(("", "nan", "none", "null", "<na>"))
-    
-    # 事前計算 (高速化のため)
-    result["_is_debit_ar"] = result["debit_account"].astype(str).str.contains(AR_ACCOUNT_PATTERN, na=False)
-    result["_is_credit_ar"] = result["credit_account"].astype(str).str.contains(AR_ACCOUNT_PATTERN, na=False)
-    result["_is_credit_ap"] = result["credit_account"].astype(str).str.contains(AP_ACCOUNT_PATTERN, na=False)
-    result["_is_debit_sales"] = result["debit_account"].astype(str).str.contains(SALES_ACCOUNT_PATTERN, na=False)
-    result["_is_credit_sales"] = result["credit_account"].astype(str).str.contains(SALES_ACCOUNT_PATTERN, na=False)
-    result["_is_debit_purchase"] = result["debit_account"].astype(str).str.contains(PURCHASE_ACCOUNT_PATTERN, na=False)
-    result["_is_credit_purchase"] = result["credit_account"].astype(str).str.contains(PURCHASE_ACCOUNT_PATTERN, na=False)
-
-    # 同一取引No補完が必要なのは複数行仕訳だけ。単一行取引のgroupbyを避ける。
-    compound_tx = valid_tx & result["transaction_no"].duplicated(keep=False)
-    for _, group in result[compound_tx].groupby("transaction_no", sort=False):
-        sales_group = _unique_group_candidate(group, (("_is_debit_ar", "debit_partner", "同一取引NoのAR借方補助科目"),))
-        purchase_group = _unique_group_candidate(group, (("_is_credit_ap", "credit_partner", "同一取引Noの買掛・未払補助科目"),))
-        ar_group = _unique_group_candidate(group, (
-            ("_is_debit_ar", "debit_partner", "同一取引NoのAR補助科目"),
-            ("_is_credit_ar", "credit_partner", "同一取引NoのAR補助科目"),
+    bank_suffix_trie = _bank_partner_suffix_trie(known_catalog)
+
+    # 行ごとの正規表現・正規化は大規模元帳で重いため、列単位で一意値ごとに1回だけ評価する。
+    debit_account = result["debit_account"]
+    credit_account = result["credit_account"]
+    is_debit_cash = _contains_mask(debit_account, CASH_ACCOUNT_PATTERN)
+    is_credit_cash = _contains_mask(credit_account, CASH_ACCOUNT_PATTERN)
+    is_debit_ar = _contains_mask(debit_account, AR_ACCOUNT_PATTERN)
+    is_credit_ar = _contains_mask(credit_account, AR_ACCOUNT_PATTERN)
+    is_debit_sales = _contains_mask(debit_account, SALES_ACCOUNT_PATTERN)
+    is_credit_sales = _contains_mask(credit_account, SALES_ACCOUNT_PATTERN)
+    is_debit_purchase = _contains_mask(debit_account, PURCHASE_ACCOUNT_PATTERN)
+    is_credit_purchase = _contains_mask(credit_account, PURCHASE_ACCOUNT_PATTERN)
+
+    # 現預金側の補助科目は取引先として扱わない。
+    raw_debit_partner = map_unique(result["debit_partner"], normalize_partner_name)
+    raw_credit_partner = map_unique(result["credit_partner"], normalize_partner_name)
+    debit_partner = raw_debit_partner.copy()
+    debit_partner[is_debit_cash] = pd.NA
+    credit_partner = raw_credit_partner.copy()
+    credit_partner[is_credit_cash] = pd.NA
+    legacy_partner = map_unique(result["partner"], normalize_partner_name)
+
+    description_partner = map_unique(result["description"], normalize_partner_name)
+    description_source = np.full(len(result), "摘要", dtype=object)
+    description_kind = map_unique(result["description"], _party_kind)
+    is_bank_entry = is_debit_cash | is_credit_cash
+    if is_bank_entry.any():
+        bank_resolved = map_unique(
+            result.loc[is_bank_entry, "description"],
+            lambda value: _extract_known_partner_from_bank_description(value, bank_suffix_trie),
+        )
+        description_partner[is_bank_entry] = [item[0] for item in bank_resolved]
+        description_source[is_bank_entry] = [item[1] for item in bank_resolved]
+        description_kind[is_bank_entry] = [item[2] for item in bank_resolved]
+    description = (description_partner, description_source)
+    legacy = (legacy_partner, "互換partner")
+    everywhere = np.ones(len(result), dtype=bool)
+
+    ar_partner = _select_candidates((
+        (is_debit_ar, ((debit_partner, "借方AR補助科目"), description, legacy)),
+        (is_credit_ar, ((credit_partner, "貸方AR補助科目"), description, legacy)),
+    ))
+    sales_partner = _select_candidates((
+        (is_credit_sales, ((debit_partner, "売上相手側補助科目"), (credit_partner, "売上側補助科目"), description, legacy)),
+        (is_debit_sales, ((credit_partner, "売上相手側補助科目"), (debit_partner, "売上側補助科目"), description, legacy)),
+    ))
+    purchase_partner = _select_candidates((
+        (is_debit_purchase, ((credit_partner, "仕入相手側補助科目"), (debit_partner, "仕入側補助科目"), description, legacy)),
+        (is_credit_purchase, ((debit_partner, "仕入相手側補助科目"), (credit_partner, "仕入側補助科目"), description, legacy)),
+    ))
+    payment_partner = _select_candidates((
+        (is_credit_cash, ((debit_partner, "支払先側補助科目"), description, legacy)),
+        (is_debit_cash, ((credit_partner, "入金元側補助科目"), description, legacy)),
+        (everywhere, ((debit_partner, "借方補助科目"), (credit_partner, "貸方補助科目"), description, legacy)),
+    ))
+
+    resolved = {
+        name: (values, sources, np.where(
+            np.array([source.startswith(("摘要", "銀行摘要")) for source in sources], dtype=bool),
+            description_kind, "unknown",
         ))
-        for column, candidate in (("sales", sales_group), ("purchase", purchase_group), ("ar", ar_group)):
-            value, source = candidate
-            if pd.isna(value):
-                continue
-            if column == "sales":
-                relevant = group["_is_debit_sales"] | group["_is_credit_sales"]
-                low_confidence = group["sales_partner_source"] != "売上相手側補助科目"
-                target_rows = group.index[relevant & low_confidence]
-            elif column == "purchase":
-                relevant = group["_is_debit_purchase"] | group["_is_credit_purchase"]
-                low_confidence = group["purchase_partner_source"] != "仕入相手側補助科目"
-                target_rows = group.index[relevant & low_confidence]
-            else:
-                target_rows = group.index[group["ar_partner"].isna()]
-            result.loc[target_rows, f"{column}_partner"] = value
-            result.loc[target_rows, f"{column}_partner_source"] = source
-            result.loc[target_rows, f"{column}_partner_kind"] = "unknown"
-
-    # 事前計算したフラグ列の削除
-    result.drop(columns=["_is_debit_ar", "_is_credit_ar", "_is_credit_ap", "_is_debit_sales", "_is_credit_sales", "_is_debit_purchase", "_is_credit_purchase"], inplace=True)
+        for name, (values, sources) in (
+            ("sales", sales_partner), ("purchase", purchase_partner), ("ar", ar_partner), ("payment", payment_partner)
+        )
+    }
+
+    # 同一取引No補完が必要なのは複数行仕訳だけ。取引単位の一意候補を集約で求め、対象行へまとめて書き戻す。
+    transaction_no = result["transaction_no"]
+    valid_tx = transaction_no.notna() & ~transaction_no.astype(str).str.lower().isin(("", "nan", "none", "null", "<na>"))
+    compound_tx = (valid_tx & transaction_no.duplicated(keep=False)).to_numpy()
+    if compound_tx.any():
+        group_fills = (
+            ("sales", "同一取引NoのAR借方補助科目",
+             ((is_debit_ar, raw_debit_partner),),
+             (is_debit_sales | is_credit_sales) & (resolved["sales"][1] != "売上相手側補助科目")),
+            ("purchase", "同一取引Noの買掛・未払補助科目",
+             ((_contains_mask(credit_account, AP_ACCOUNT_PATTERN), raw_credit_partner),),
+             (is_debit_purchase | is_credit_purchase) & (resolved["purchase"][1] != "仕入相手側補助科目")),
+            ("ar", "同一取引NoのAR補助科目",
+             ((is_debit_ar, raw_debit_partner), (is_credit_ar, raw_credit_partner)),
+             pd.isna(resolved["ar"][0])),
+        )
+        for name, source, conditions, target in group_fills:
+            candidate = _transaction_unique_candidate(transaction_no, compound_tx, conditions)
+            rows = target & pd.notna(candidate)
+            values, sources, kinds = resolved[name]
+            values[rows] = candidate[rows]
+            sources[rows] = source
+            kinds[rows] = "unknown"
+
+    for name, (values, sources, kinds) in resolved.items():
+        result[f"{name}_partner"] = values.tolist()
+        result[f"{name}_partner_source"] = sources.tolist()
+        result[f"{name}_partner_kind"] = kinds.tolist()
 
     return result
@@ -0,0 +1,104 @@
+"""売掛金回転日数（DSO）を、日付順の累積和から任意の期間・全月末について求める。"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from process.monthly_pl import contains_any
+
+
+AR_PATTERNS = ("売掛金", "未収入金", "買入金銭債権")
+SALES_PATTERNS = ("売上", "売上高")
+# 2年目以降の繰越・開始仕訳。期首日より後にあるものは集計から除く。
+CARRYOVER_DESCRIPTION_PATTERN = "開始仕訳|期首|繰越"
+CARRYOVER_ACCOUNT_PATTERN = "前期繰越|元入金"
+# 期間売上がこれ以下なら回転日数は 0 とする。
+MIN_SALES = 1000
+MAX_DAYS = 999.0
+
+
+def _prefix_sums(values: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0.0], np.cumsum(values)))
+
+
+class ReceivableDays:
+    """date（datetime）を持つ仕訳の売掛金回転日数。
+
+    期間は期首日（期間内最初の日付の月初）から期末日（最後の日付の月末）まで。期首日の借方売掛金を
+    期首残高とし、回収が多すぎる場合は期首残高を逆算で補正する。行ごとの金額を日付順に並べて
+    「期首日の行」と「期首日より後の繰越以外の行」の累積和を持つため、どの期間も二分探索と差分で求まる。
+    """
+
+    def __init__(self, journal: pd.DataFrame):
+        frame = journal.sort_values("date", kind="stable")
+        self.dates = frame["date"].to_numpy(dtype="datetime64[ns]")
+
+        debit = pd.to_numeric(frame["debit_amount"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        credit = pd.to_numeric(frame["credit_amount"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        debit_ar = np.where(contains_any(frame["debit_account"], AR_PATTERNS), debit, 0.0)
+        credit_ar = np.where(contains_any(frame["credit_account"], AR_PATTERNS), credit, 0.0)
+        sales = np.where(contains_any(frame["credit_account"], SALES_PATTERNS), credit, 0.0)
+        carryover = (
+            frame["description"].astype(str).str.contains(CARRYOVER_DESCRIPTION_PATTERN, na=False)
+            | frame["debit_account"].astype(str).str.contains(CARRYOVER_ACCOUNT_PATTERN, na=False)
+            | frame["credit_account"].astype(str).str.contains(CARRYOVER_ACCOUNT_PATTERN, na=False)
+        ).to_numpy()
+
+        # all_*: 期首日の行用（繰越も含む）。clean_*: 期首日より後の行用（繰越を除く）。
+        self._all = {name: _prefix_sums(values) for name, values in
+                     (("debit_ar", debit_ar), ("credit_ar", credit_ar), ("sales", sales))}
+        self._clean = {name: _prefix_sums(np.where(carryover, 0.0, values)) for name, values in
+                       (("debit_ar", debit_ar), ("credit_ar", credit_ar), ("sales", sales))}
+
+    def _days(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """日付順の行位置 [lo, hi) を期間とした回転日数。"""
+        lo = np.asarray(lo, dtype=np.int64)
+        hi = np.asarray(hi, dtype=np.int64)
+        days = np.zeros(len(lo))
+        valid = hi > lo
+        if not valid.any():
+            return days
+        lo, hi = lo[valid], hi[valid]
+
+        start = self.dates[lo].astype("datetime64[M]")
+        end = self.dates[hi - 1].astype("datetime64[M]") + np.timedelta64(1, "M")
+        period_days = (end.astype("datetime64[D]") - start.astype("datetime64[D]")).astype(np.int64)
+        # 期首日ちょうどの行は [lo, opening_end)
+        opening_end = np.clip(np.searchsorted(self.dates, start.astype("datetime64[ns]"), side="right"), lo, hi)
+
+        def opening(name):
+            return self._all[name][opening_end] - self._all[name][lo]
+
+        def rest(name):
+            return self._clean[name][hi] - self._clean[name][opening_end]
+
+        total_op = opening("debit_ar")
+        total_deb = rest("debit_ar")
+        total_cred = opening("credit_ar") + rest("credit_ar")
+        sales = opening("sales") + rest("sales")
+
+        # 逆算フォールバック（全体レベルで回収が多すぎる場合のみ期首を補正）
+        total_op_adj = np.maximum(total_op, total_cred - total_deb)
+        ending = total_op_adj + total_deb - total_cred
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = np.where(sales > MIN_SALES, np.minimum(ending / sales * period_days, MAX_DAYS), 0.0)
+        days[valid] = result
+        return days
+
+    def between(self, after=None, until=None) -> float:
+        """after より後、until 以前（指定したものだけ）の行を期間とした回転日数。"""
+        lo = 0 if after is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(after)), side="right")
+        hi = len(self.dates) if until is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(until)), side="right")
+        return float(self._days([lo], [hi])[0])
+
+    def monthly(self, window_months: int = 12) -> pd.Series:
+        """各月末時点で、直近 window_months か月の行を期間とした回転日数。"""
+        if len(self.dates) == 0:
+            return pd.Series(dtype=float, name="dso")
+        months = pd.period_range(pd.Timestamp(self.dates[0]), pd.Timestamp(self.dates[-1]), freq="M")
+        month_ends = (months + 1).start_time.to_numpy(dtype="datetime64[ns]")
+        window_starts = (months + 1 - window_months).start_time.to_numpy(dtype="datetime64[ns]")
+        lo = np.searchsorted(self.dates, window_starts, side="left")
+        hi = np.searchsorted(self.dates, month_ends, side="left")
+        return pd.Series(self._days(lo, hi), index=pd.Index(months, name="year_month"), name="dso")
@@ -0,0 +1,131 @@
+"""取引先解決を1回だけ行い、そこから導く明細ビューを仕訳内容単位で使い回す。"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from process.partner_activity import PartnerActivityCube
+from process.partner_resolution import resolve_partner_columns
+from process.transaction_details import (
+    PartnerAliasIndex,
+    build_partner_alias_index,
+    build_customer_relationship_events,
+    build_direct_sales_details,
+    build_purchase_details,
+    build_sales_details,
+)
+
+
+# 同時に保持する解決済み仕訳の数。1報告で使う仕訳（標準化済み・クレンジング済み）が収まればよい。
+CACHE_SIZE = 4
+
+
+def journal_fingerprint(df: pd.DataFrame) -> str:
+    """列名・行数・全セル値から仕訳の内容指紋を作る。indexは解決時に振り直すため含めない。"""
+    digest = hashlib.sha1()
+    digest.update(repr((tuple(str(column) for column in df.columns), df.shape)).encode("utf-8"))
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ResolvedJournal:
+    """取引先解決済みの仕訳と、その派生ビュー（売上・仕入明細、顧客イベント等）を保持する。
+
+    派生ビューは初回参照時に1回だけ計算して共有する。返す DataFrame は読み取り専用として扱い、
+    加工する場合は呼び出し側で copy() すること。
+    """
+
+    _cache: OrderedDict[tuple[str, bool], ResolvedJournal] = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, df: pd.DataFrame, force: bool = False, fingerprint: str | None = None):
+        self.fingerprint = fingerprint or journal_fingerprint(df)
+        self.frame = resolve_partner_columns(df, force=force)
+        self._views: dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def of(cls, df: pd.DataFrame, force: bool = False) -> ResolvedJournal:
+        """同じ内容の仕訳には同じインスタンスを返す。"""
+        key = (journal_fingerprint(df), force)
+        with cls._cache_lock:
+            journal = cls._cache.get(key)
+            if journal is not None:
+                cls._cache.move_to_end(key)
+                return journal
+        journal = cls(df, force=force, fingerprint=key[0])
+        with cls._cache_lock:
+            journal = cls._cache.setdefault(key, journal)
+            cls._cache.move_to_end(key)
+            while len(cls._cache) > CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return journal
+
+    def dated(self) -> ResolvedJournal:
+        """日付を解釈できる行だけに絞った解決済み仕訳。派生ビューもその行だけから作る。
+
+        取引先解決は全行で行った結果をそのまま使う。
+        """
+        return self.view("dated", self._build_dated)
+
+    def _build_dated(self) -> ResolvedJournal:
+        frame = self.frame.copy()
+        frame['date'] = pd.to_datetime(frame['date'], errors='coerce')
+        dated = object.__new__(ResolvedJournal)
+        dated.fingerprint = f"{self.fingerprint}:dated"
+        dated.frame = frame.dropna(subset=['date'])
+        dated._views = {}
+        dated._lock = threading.RLock()
+        return dated
+
+    def view(self, name: str, builder):
+        """name の派生ビューを未計算なら builder で作り、以後は同じ結果を返す。"""
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = builder()
+            return self._views[name]
+
+    def alias_index(self) -> PartnerAliasIndex:
+        """この仕訳の取引先名で作った名寄せ照合器。各明細の名寄せで共有する。"""
+        return self.view("alias_index", lambda: build_partner_alias_index(self.frame))
+
+    def sales_details(self) -> pd.DataFrame:
+        return self.view(
+            "sales_details", lambda: build_sales_details(self.frame, alias_index=self.alias_index())
+        )
+
+    def purchase_details(self) -> pd.DataFrame:
+        return self.view(
+            "purchase_details", lambda: build_purchase_details(self.frame, alias_index=self.alias_index())
+        )
+
+    def direct_sales_details(self) -> pd.DataFrame:
+        return self.view(
+            "direct_sales_details",
+            lambda: build_direct_sales_details(self.frame, alias_index=self.alias_index()),
+        )
+
+    def customer_events(self) -> pd.DataFrame:
+        return self.view(
+            "customer_events",
+            lambda: build_customer_relationship_events(
+                self.frame, sales=self.sales_details(), alias_index=self.alias_index()
+            ),
+        )
+
+    def sales_activity(self) -> PartnerActivityCube:
+        return self.view("sales_activity", lambda: PartnerActivityCube(self.sales_details()))
+
+    def purchase_activity(self) -> PartnerActivityCube:
+        return self.view("purchase_activity", lambda: PartnerActivityCube(self.purchase_details()))
+
+    def customer_activity(self) -> PartnerActivityCube:
+        return self.view(
+            "customer_activity",
+            lambda: PartnerActivityCube(self.customer_events(), category_column="relationship_source"),
+        )
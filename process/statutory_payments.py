@@ -1,5 +1,10 @@
+import re
+
+import numpy as np
 import pandas as pd
 
+from process.fifo_settlement import settle_fifo
+
 
 CATEGORIES = {
     "源泉所得税": {"keywords": ("所得税", "源泉"), "accounts": ("預り金", "法定福利費")},
@@ -7,44 +12,80 @@ CATEGORIES = {
     "社会保険料": {"keywords": ("社会保険", "健康保険", "厚生年金"), "accounts": ("預り金", "法定福利費")},
 }
 
+BANK_WORDS = ("預金", "現金", "当座", "普通", "手形", "電信")
+
 
 def _contains_any(value, keywords) -> bool:
     return any(keyword in str(value) for keyword in keywords) if pd.notna(value) else False
 
 
-def _has_bank_credit(row, journal) -> bool:
-    bank_words = ("預金", "現金", "当座", "普通", "手形", "電信")
-    if _contains_any(row.get("credit_account"), bank_words):
-        return True
-    tx = row.get("transaction_no")
-    if pd.isna(tx) or not str(tx).strip() or str(tx).lower() in {"nan", "none", "null", "<na>"}:
-        return False
-    related = journal[journal["transaction_no"] == tx]
-    return related["credit_account"].apply(lambda value: _contains_any(value, bank_words)).any()
+def _transaction_codes(data: pd.DataFrame) -> np.ndarray:
+    """取引No単位のグループ番号（出現順）。取引Noの無い行はそれぞれ単独の取引として扱う。"""
+    transaction_no = data["transaction_no"]
+    text = transaction_no.astype(str)
+    valid = transaction_no.notna() & (text.str.strip() != "") & ~text.str.lower().isin(["nan", "none", "null", "<na>"])
+    keys = text.where(valid, "__row_" + pd.Series(data.index, index=data.index).astype(str))
+    codes, _ = pd.factorize(keys)
+    return codes
 
 
-def _matches_category(row, config, side: str) -> bool:
-    account = row.get(f"{side}_account")
-    partner = row.get(f"{side}_partner")
-    if not _contains_any(account, config["accounts"]):
-        return False
-    # 補助科目が明示されている場合はそれを優先する。摘要には別項目名が併記されることがあり、
-    # 例: 借方「所得税」／貸方「雇用保険」、摘要「所得税 雇用保険」。
-    if pd.notna(partner) and str(partner).strip():
-        return _contains_any(partner, config["keywords"])
-    return _contains_any(row.get("description"), config["keywords"])
+def _column(data: pd.DataFrame, name: str) -> pd.Series:
+    return data[name] if name in data.columns else pd.Series(pd.NA, index=data.index, dtype="object")
 
 
-def _transaction_key(index, value):
-    if pd.isna(value) or not str(value).strip() or str(value).lower() in {"nan", "none", "null", "<na>"}:
-        return f"__row_{index}"
-    return str(value)
+def _contains_any_column(series: pd.Series, keywords) -> pd.Series:
+    """_contains_any の列版。"""
+    pattern = "|".join(re.escape(keyword) for keyword in keywords)
+    return series.notna() & series.astype(str).str.contains(pattern, regex=True)
 
 
-def _settlement_date(group: pd.DataFrame, journal: pd.DataFrame):
+def _category_amounts(data: pd.DataFrame, config, side: str) -> np.ndarray:
+    """項目の科目に該当し、補助科目（無ければ摘要）に項目名がある行の金額。当たらない行は0。"""
+    partner = _column(data, f"{side}_partner")
+    # 補助科目が明示されている場合はそれを優先する。摘要には別項目名が併記されることがあり、
+    # 例: 借方「所得税」／貸方「雇用保険」、摘要「所得税 雇用保険」。
+    has_partner = partner.notna() & (partner.astype(str).str.strip() != "")
+    keyword_hit = np.where(
+        has_partner,
+        _contains_any_column(partner, config["keywords"]),
+        _contains_any_column(_column(data, "description"), config["keywords"]),
+    )
+    matched = _contains_any_column(_column(data, f"{side}_account"), config["accounts"]).to_numpy() & keyword_hit
+    if f"{side}_amount" not in data.columns:
+        return np.zeros(len(data))
+    amounts = pd.to_numeric(data[f"{side}_amount"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    return np.where(matched, amounts, 0.0)
+
+
+class _ClearingPaymentIndex:
+    """銀行から出金された行を日付順に持ち、清算科目ごとの決済候補を二分探索で引く索引。"""
+
+    def __init__(self, journal: pd.DataFrame):
+        bank_rows = journal[_contains_any_column(_column(journal, "credit_account"), BANK_WORDS).to_numpy()]
+        bank_rows = bank_rows.sort_values("date", kind="stable")
+        self._dates = pd.DatetimeIndex(bank_rows["date"])
+        self._debit_accounts = _column(bank_rows, "debit_account").fillna("").astype(str)
+        self._amounts = pd.to_numeric(_column(bank_rows, "debit_amount"), errors="coerce").to_numpy(dtype=float)
+        self._by_account: dict[str, tuple[pd.DatetimeIndex, np.ndarray]] = {}
+
+    def _account_rows(self, account: str):
+        if account not in self._by_account:
+            mask = self._debit_accounts.str.contains(account, regex=False).to_numpy()
+            self._by_account[account] = (self._dates[mask], self._amounts[mask])
+        return self._by_account[account]
+
+    def first_match(self, account: str, start: pd.Timestamp, end: pd.Timestamp, amount: float):
+        """借方が account を含み、start〜end に金額差1円以内で決済された最初の日付。"""
+        dates, amounts = self._account_rows(account)
+        lower = dates.searchsorted(start, side="left")
+        upper = dates.searchsorted(end, side="right")
+        hits = np.flatnonzero(np.abs(amounts[lower:upper] - amount) <= 1.0)
+        return dates[lower + hits[0]] if hits.size else None
+
+
+def _settlement_date(group: pd.DataFrame, clearing_index: _ClearingPaymentIndex):
     """直接銀行決済、または未払金等へ振替後の銀行決済日を返す。"""
-    bank_words = ("預金", "現金", "当座", "普通", "手形", "電信")
-    if group["credit_account"].apply(lambda value: _contains_any(value, bank_words)).any():
+    if group["credit_account"].apply(lambda value: _contains_any(value, BANK_WORDS)).any():
         return group["date"].max()
 
     clearing_mask = group["credit_account"].fillna("").astype(str).str.contains("未払金|未払費用", regex=True)
@@ -54,27 +95,28 @@ def _settlement_date(group: pd.DataFrame, journal: pd.DataFrame):
     clearing_accounts = group.loc[clearing_mask, "credit_account"].dropna().astype(str).unique()
     start = group["date"].max()
     end = start + pd.Timedelta(days=10)
-    later = journal[(journal["date"] >= start) & (journal["date"] <= end)]
     for account in clearing_accounts:
-        candidates = later[
-            later["debit_account"].fillna("").astype(str).str.contains(account, regex=False)
-            & later["credit_account"].apply(lambda value: _contains_any(value, bank_words))
-        ]
-        for _, candidate in candidates.iterrows():
-            amount = pd.to_numeric(candidate.get("debit_amount"), errors="coerce")
-            if pd.notna(amount) and abs(float(amount) - clearing_total) <= 1.0:
-                return candidate["date"]
+        paid_date = clearing_index.first_match(account, start, end, clearing_total)
+        if paid_date is not None:
+            return paid_date
     return None
 
 
-def _due_date(category: str, occurrence_date: pd.Timestamp, withholding_special: bool) -> pd.Timestamp:
+def _due_dates(category: str, occurrence_dates: pd.Series, withholding_special: bool) -> pd.Series:
+    """発生日ごとの納付期限。源泉所得税の納期特例は半期ごと、それ以外は月単位の期限。"""
     if category == "源泉所得税" and withholding_special:
-        if occurrence_date.month <= 6:
-            return pd.Timestamp(occurrence_date.year, 7, 20)
-        return pd.Timestamp(occurrence_date.year + 1, 1, 31)
-    if category == "社会保険料":
-        return occurrence_date.to_period("M").start_time + pd.DateOffset(months=2, days=4)
-    return occurrence_date.to_period("M").start_time + pd.DateOffset(months=1, days=14)
+        first_half = occurrence_dates.dt.month <= 6
+        year = occurrence_dates.dt.year
+        return pd.Series(
+            np.where(
+                first_half,
+                pd.to_datetime({"year": year, "month": 7, "day": 20}),
+                pd.to_datetime({"year": year + 1, "month": 1, "day": 31}),
+            ),
+            index=occurrence_dates.index,
+        )
+    months, days = (2, 4) if category == "社会保険料" else (1, 14)
+    return (occurrence_dates.dt.to_period("M") + months).dt.start_time + pd.Timedelta(days=days)
 
 
 def build_statutory_payment_ledger(journal: pd.DataFrame):
@@ -84,63 +126,68 @@ def build_statutory_payment_ledger(journal: pd.DataFrame):
     data = journal.copy()
     data["date"] = pd.to_datetime(data["date"], errors="coerce")
     data = data.dropna(subset=["date"]).sort_values("date")
+    if data.empty:
+        return pd.DataFrame(), False
 
-    data["_tx_key"] = [_transaction_key(index, value) for index, value in zip(data.index, data["transaction_no"])]
-    grouped_transactions = list(data.groupby("_tx_key", sort=False))
-
-    payment_counts = 0
-    for _, group in grouped_transactions:
-        config = CATEGORIES["源泉所得税"]
-        debit = pd.to_numeric(group.apply(lambda row: row.get("debit_amount", 0) if _matches_category(row, config, "debit") else 0, axis=1), errors="coerce").fillna(0.0).sum()
-        credit = pd.to_numeric(group.apply(lambda row: row.get("credit_amount", 0) if _matches_category(row, config, "credit") else 0, axis=1), errors="coerce").fillna(0.0).sum()
-        if debit > credit and _settlement_date(group, data) is not None:
-            payment_counts += 1
+    # 取引×項目の純額は、行ごとの項目判定を一度だけ列で行ってから取引単位に合計する。
+    codes = _transaction_codes(data)
+    n_transactions = codes.max() + 1
+    net_amounts = {
+        category: (
+            np.bincount(codes, weights=_category_amounts(data, config, "credit"), minlength=n_transactions)
+            - np.bincount(codes, weights=_category_amounts(data, config, "debit"), minlength=n_transactions)
+        )
+        for category, config in CATEGORIES.items()
+    }
+    event_dates = data["date"].groupby(codes).min()
+    group_positions = data.groupby(codes, sort=False).indices
+    clearing_index = _ClearingPaymentIndex(data)
+    settlement_dates = {}
+
+    def settlement_date(code):
+        if code not in settlement_dates:
+            settlement_dates[code] = _settlement_date(data.iloc[group_positions[code]], clearing_index)
+        return settlement_dates[code]
+
+    payment_counts = sum(
+        1 for code in np.flatnonzero(net_amounts["源泉所得税"] < 0) if settlement_date(code) is not None
+    )
     month_span = max(1, (data["date"].max().year - data["date"].min().year) * 12
                      + data["date"].max().month - data["date"].min().month + 1)
     withholding_special = month_span >= 6 and payment_counts / month_span <= 2 / 12
 
-    ledger_rows = []
-    for category, config in CATEGORIES.items():
-        occurrences = []
-        payments = []
-        for _, group in grouped_transactions:
-            debit = pd.to_numeric(
-                group.apply(lambda row: row.get("debit_amount", 0) if _matches_category(row, config, "debit") else 0, axis=1),
-                errors="coerce",
-            ).fillna(0.0).sum()
-            credit = pd.to_numeric(
-                group.apply(lambda row: row.get("credit_amount", 0) if _matches_category(row, config, "credit") else 0, axis=1),
-                errors="coerce",
-            ).fillna(0.0).sum()
-            net = float(credit - debit)
-            event_date = group["date"].min()
-            if net > 0:
-                occurrences.append({"date": event_date, "original": net, "remaining": net})
-            elif net < 0:
-                paid_date = _settlement_date(group, data)
-                if paid_date is not None:
-                    payments.append({"date": paid_date, "remaining": -net})
+    ledgers = []
+    for category in CATEGORIES:
+        net = net_amounts[category]
+        occurrence_codes = np.flatnonzero(net > 0)
+        if not occurrence_codes.size:
+            continue
+        payment_dates = []
+        payment_amounts = []
+        for code in np.flatnonzero(net < 0):
+            paid_date = settlement_date(code)
+            if paid_date is not None:
+                payment_dates.append(paid_date)
+                payment_amounts.append(-net[code])
 
         # 項目内でのみ、発生日以前の債務へ古い順に充当する。
-        for payment in payments:
-            for occurrence in occurrences:
-                if occurrence["date"] > payment["date"] or occurrence["remaining"] <= 0:
-                    continue
-                applied = min(occurrence["remaining"], payment["remaining"])
-                occurrence["remaining"] -= applied
-                payment["remaining"] -= applied
-                if payment["remaining"] <= 0:
-                    break
-
-        for occurrence in occurrences:
-            due = _due_date(category, occurrence["date"], withholding_special)
-            ledger_rows.append({
-                "category": category, "occurrence_date": occurrence["date"], "due_date": due,
-                "original_amount": occurrence["original"], "remaining_amount": occurrence["remaining"],
-                "is_overdue": occurrence["remaining"] > 0 and data["date"].max() >= due,
-            })
-
-    return pd.DataFrame(ledger_rows), withholding_special
+        occurrence_dates = event_dates.iloc[occurrence_codes]
+        ledger = pd.DataFrame({
+            "category": category,
+            "occurrence_date": occurrence_dates.to_numpy(),
+            "original_amount": net[occurrence_codes],
+            "remaining_amount": settle_fifo(
+                net[occurrence_codes], payment_amounts,
+                obligation_dates=occurrence_dates, payment_dates=payment_dates,
+            ),
+        })
+        ledger.insert(2, "due_date", _due_dates(category, ledger["occurrence_date"], withholding_special))
+        ledger["is_overdue"] = (ledger["remaining_amount"] > 0) & (data["date"].max() >= ledger["due_date"])
+        ledgers.append(ledger)
+
+    if not ledgers:
+        return pd.DataFrame(), withholding_special
+    return pd.concat(ledgers, ignore_index=True), withholding_special
 
 
 def evaluate_statutory_payments(journal: pd.DataFrame):
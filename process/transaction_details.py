@@ -1,3 +1,7 @@
+import re
+from collections import deque
+
+import numpy as np
 import pandas as pd
 
 from process.partner_resolution import (
@@ -6,6 +10,7 @@ from process.partner_resolution import (
     CASH_ACCOUNT_PATTERN,
     PURCHASE_ACCOUNT_PATTERN,
     SALES_ACCOUNT_PATTERN,
+    map_unique,
     normalize_partner_name,
     resolve_partner_columns,
 )
@@ -14,47 +19,119 @@ from process.partner_resolution import (
 UNKNOWN_PARTNER = "取引先不明"
 NON_PARTNER_LABELS = {UNKNOWN_PARTNER, "現金売上", "掛売上", "売上", "売掛金回収"}
 EXPENSE_NAME_PATTERN = r"費$|手当$|仕入高$|売上高$|製造経費$|外注加工費$|消耗費$|通信費$"
+_EXPENSE_NAME_RE = re.compile(EXPENSE_NAME_PATTERN)
+DETAIL_COLUMNS = ["date", "transaction_no", "partner", "amount", "source"]
+# 名寄せで寄せ先として扱う最短の名称長。
+ALIAS_MIN_LENGTH = 3
+# 明細の取引先名の元になる列。仕訳単位の名寄せ照合器はこれらから作る。
+PARTNER_NAME_COLUMNS = (
+    "sales_partner", "purchase_partner", "ar_partner", "payment_partner", "debit_partner", "credit_partner",
+)
 
 
-def consolidate_partner_aliases(values: pd.Series, protected_names=None) -> pd.Series:
-    """会社種別等を除去し、包含関係にある名称を共通名へ寄せる。"""
+class PartnerAliasIndex:
+    """取引先名を語彙とする Aho-Corasick 照合器。名称1件を1回なぞるだけで、含まれる語彙を全て列挙する。
+
+    仕訳全体の取引先名で1回だけ作り、各明細の名寄せで共有する。
+    """
+
+    def __init__(self, names):
+        self.names = frozenset(
+            str(name) for name in names
+            if pd.notna(name) and len(str(name)) >= ALIAS_MIN_LENGTH
+        )
+        self._goto: list[dict[str, int]] = [{}]
+        self._output: list[str | None] = [None]
+        for name in sorted(self.names):
+            node = 0
+            for char in name:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._output.append(None)
+                node = next_node
+            self._output[node] = name
+        self._fail = [0] * len(self._goto)
+        # 失敗リンクを辿った先で最初に語彙が終わるノード。語彙の列挙を出力数に比例させる。
+        self._output_link = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0) if node else 0
+                self._fail[child] = target
+                self._output_link[child] = target if self._output[target] else self._output_link[target]
+
+    def matches(self, text: str):
+        """text に部分文字列として含まれる語彙を返す。"""
+        goto, fail, output, output_link = self._goto, self._fail, self._output, self._output_link
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            found = node if output[node] else output_link[node]
+            while found:
+                yield output[found]
+                found = output_link[found]
+
+
+def build_partner_alias_index(df: pd.DataFrame) -> PartnerAliasIndex:
+    """解決済み仕訳に現れる取引先名（正規化後）で名寄せ用の照合器を作る。"""
+    columns = [column for column in PARTNER_NAME_COLUMNS if column in df.columns]
+    if not columns:
+        return PartnerAliasIndex(())
+    raw_names = pd.unique(pd.concat([df[column] for column in columns], ignore_index=True).dropna())
+    return PartnerAliasIndex(normalize_partner_name(name) for name in raw_names)
+
+
+def consolidate_partner_aliases(
+    values: pd.Series, protected_names=None, alias_index: PartnerAliasIndex | None = None
+) -> pd.Series:
+    """会社種別等を除去し、包含関係にある名称を共通名へ寄せる。
+
+    alias_index に仕訳単位の照合器を渡すと、それに無い名称だけを追加で索引化する。
+    """
     normalized = values.apply(normalize_partner_name)
     protected = {
         str(name) for name in (protected_names or set())
         if pd.notna(name) and str(name).strip()
     }
-    names = sorted(
-        {str(value) for value in normalized.dropna() if str(value).strip()},
-        key=lambda value: (len(value), value),
-    )
+    names = {str(value) for value in normalized.dropna() if str(value).strip()}
+    # 寄せ先になれるのは、この系列に現れる3文字以上の非保護名だけ。
+    short_names = {name for name in names if len(name) >= ALIAS_MIN_LENGTH and name not in protected}
+    indexes = []
+    if alias_index is not None:
+        indexes.append(alias_index)
+        missing = short_names - alias_index.names
+    else:
+        missing = short_names
+    if missing:
+        indexes.append(PartnerAliasIndex(missing))
+
     aliases = {}
-    for short_name in names:
-        if short_name in protected:
+    for long_name in names:
+        if long_name in protected:
             continue
-        if len(short_name) < 3:
-            continue
-        for long_name in names:
-            if long_name in protected:
-                continue
-            if short_name == long_name:
-                continue
-            if short_name in long_name:
-                aliases[long_name] = short_name
+        # 含まれる名称のうち最長（同長なら辞書順で最後）のものへ寄せる。
+        best = None
+        for index in indexes:
+            for short_name in index.matches(long_name):
+                if short_name == long_name or short_name not in short_names:
+                    continue
+                if best is None or (len(short_name), short_name) > (len(best), best):
+                    best = short_name
+        if best is not None:
+            aliases[long_name] = best
     return normalized.replace(aliases)
 
 
-def calculate_top3_share(details: pd.DataFrame) -> float | None:
-    """不明額は分母だけに含め、判明先の上位3社を分子にする。"""
-    if details.empty:
-        return None
-    amounts = details.groupby("partner")["amount"].sum().sort_values(ascending=False)
-    denominator = amounts.sum()
-    if denominator <= 0:
-        return None
-    numerator = amounts.drop(index=UNKNOWN_PARTNER, errors="ignore").head(3).sum()
-    return float(numerator / denominator * 100)
-
-
 def _contains(series: pd.Series, pattern: str) -> pd.Series:
     return series.fillna("").astype(str).str.contains(pattern, regex=True, na=False)
 
@@ -63,121 +140,130 @@ def _amount(value) -> float:
     return float(pd.to_numeric(value, errors="coerce") or 0.0)
 
 
-def _tx_key(row_index, value):
-    if pd.isna(value) or not str(value).strip() or str(value).lower() in {"nan", "none", "null", "<na>"}:
-        return f"__row_{row_index}"
-    return str(value)
-
-
-def _append_allocations(records, group, candidates, total_amount, source):
-    candidates = candidates.copy()
-    candidates["_candidate_amount"] = pd.to_numeric(candidates["_candidate_amount"], errors="coerce").fillna(0.0)
-    candidates = candidates[candidates["_candidate_amount"] > 0]
-    if candidates.empty or total_amount <= 0:
-        return False
-
-    candidate_total = candidates["_candidate_amount"].sum()
-    for _, candidate in candidates.iterrows():
-        partner = candidate.get("_candidate_partner")
-        amount = total_amount * candidate["_candidate_amount"] / candidate_total
-        records.append({
-            "date": candidate.get("date", group["date"].min()),
-            "transaction_no": candidate.get("transaction_no"),
-            "partner": partner if pd.notna(partner) else UNKNOWN_PARTNER,
-            "amount": amount,
-            "source": source,
-        })
-    return True
-
-
-def build_sales_details(df: pd.DataFrame) -> pd.DataFrame:
-    """売上高を、売掛金内訳優先・直入金次点で取引先別明細へ展開する。"""
-    journal = resolve_partner_columns(df)
-    journal["_tx_key"] = [
-        _tx_key(index, value) for index, value in zip(journal.index, journal["transaction_no"])
-    ]
-    records = []
-
-    for _, group in journal.groupby("_tx_key", sort=False):
-        credit_sales = group[_contains(group["credit_account"], SALES_ACCOUNT_PATTERN)].copy()
-        total_sales = pd.to_numeric(credit_sales.get("credit_amount"), errors="coerce").fillna(0.0).sum()
-        if total_sales <= 0:
-            continue  # 返品・売上取消は現方針どおり差し引かない
-
-        ar_rows = group[_contains(group["debit_account"], AR_ACCOUNT_PATTERN)].copy()
-        cash_rows = group[
-            _contains(group["debit_account"], CASH_ACCOUNT_PATTERN)
-            & _contains(group["credit_account"], SALES_ACCOUNT_PATTERN)
-        ].copy()
-        if not ar_rows.empty:
-            ar_rows["_candidate_partner"] = ar_rows["ar_partner"]
-            ar_rows["_candidate_amount"] = ar_rows["debit_amount"]
-            if not cash_rows.empty:
-                cash_rows["_candidate_partner"] = cash_rows["sales_partner"]
-                cash_rows["_candidate_amount"] = cash_rows["debit_amount"]
-                ar_rows = pd.concat([ar_rows, cash_rows], ignore_index=True)
-                source = "売掛金・直入金内訳"
-            else:
-                source = "売掛金内訳"
-            if _append_allocations(records, group, ar_rows, total_sales, source):
-                continue
-
-        if not cash_rows.empty:
-            cash_rows["_candidate_partner"] = cash_rows["sales_partner"]
-            cash_rows["_candidate_amount"] = cash_rows["debit_amount"]
-            if _append_allocations(records, group, cash_rows, total_sales, "直入金売上"):
-                continue
-
-        direct = credit_sales.copy()
-        direct["_candidate_partner"] = direct["sales_partner"]
-        direct["_candidate_amount"] = direct["credit_amount"]
-        if not _append_allocations(records, group, direct, total_sales, "売上仕訳"):
-            records.append({
-                "date": group["date"].min(), "transaction_no": group["transaction_no"].iloc[0],
-                "partner": UNKNOWN_PARTNER, "amount": total_sales, "source": "取引先復元不能",
-            })
-
-    result = pd.DataFrame(records, columns=["date", "transaction_no", "partner", "amount", "source"])
+def _tx_codes(journal: pd.DataFrame) -> np.ndarray:
+    """取引No単位のグループ番号（出現順）。取引Noの無い行はそれぞれ単独の取引として扱う。"""
+    transaction_no = journal["transaction_no"]
+    text = transaction_no.astype(str)
+    valid = transaction_no.notna() & (text.str.strip() != "") & ~text.str.lower().isin(["nan", "none", "null", "<na>"])
+    keys = text.where(valid, "__row_" + pd.Series(journal.index, index=journal.index).astype(str))
+    codes, _ = pd.factorize(keys)
+    return codes
+
+
+def _amount_column(journal: pd.DataFrame, column: str) -> np.ndarray:
+    return pd.to_numeric(journal[column], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+
+def _allocate_by_priority(journal: pd.DataFrame, codes: np.ndarray, totals: np.ndarray, tiers) -> tuple[pd.DataFrame, np.ndarray]:
+    """取引ごとに、正額の候補行がある最上位の段で取引総額を候補額比で按分する。
+
+    tiers は優先順の段のリストで、各段は (行マスク, 取引先, 候補額, 取得元) の組の列。
+    同じ段の組は列挙順・行順に明細化する。どの段でも按分できなかった取引のマスクも返す。
+    """
+    n_groups = len(totals)
+    eligible = totals[codes] > 0
+    parts = []
+    for tier, candidates in enumerate(tiers):
+        for order, (mask, partners, amounts, source) in enumerate(candidates):
+            rows = np.flatnonzero(mask & eligible & (amounts > 0))
+            parts.append(pd.DataFrame({
+                "_code": codes[rows], "_tier": tier, "_order": order, "_row": rows,
+                "partner": partners[rows], "_candidate_amount": amounts[rows],
+                "source": source[rows] if isinstance(source, np.ndarray) else source,
+            }))
+    candidates = pd.concat(parts, ignore_index=True)
+    chosen_tier = np.full(n_groups, len(tiers))
+    np.minimum.at(chosen_tier, candidates["_code"].to_numpy(), candidates["_tier"].to_numpy())
+    candidates = candidates[candidates["_tier"].to_numpy() == chosen_tier[candidates["_code"].to_numpy()]]
+    candidates = candidates.sort_values(["_code", "_tier", "_order", "_row"], kind="stable")
+
+    group_codes = candidates["_code"].to_numpy()
+    candidate_amount = candidates["_candidate_amount"].to_numpy()
+    candidate_total = np.bincount(group_codes, weights=candidate_amount, minlength=n_groups)
+    rows = candidates["_row"].to_numpy()
+    allocations = pd.DataFrame({
+        "date": journal["date"].take(rows).tolist(),
+        "transaction_no": journal["transaction_no"].take(rows).tolist(),
+        "partner": [partner if pd.notna(partner) else UNKNOWN_PARTNER for partner in candidates["partner"]],
+        "amount": totals[group_codes] * candidate_amount / candidate_total[group_codes],
+        "source": candidates["source"].tolist(),
+        "_code": group_codes,
+    })
+    unallocated = (totals > 0) & (chosen_tier == len(tiers))
+    return allocations, unallocated
+
+
+def _details_frame(allocations: pd.DataFrame, alias_index: PartnerAliasIndex | None) -> pd.DataFrame:
+    records = allocations.sort_values("_code", kind="stable")[DETAIL_COLUMNS].to_dict("records")
+    result = pd.DataFrame(records, columns=DETAIL_COLUMNS)
     if not result.empty:
-        result["partner"] = consolidate_partner_aliases(result["partner"]).fillna(UNKNOWN_PARTNER)
+        result["partner"] = consolidate_partner_aliases(result["partner"], alias_index=alias_index).fillna(UNKNOWN_PARTNER)
     return result
 
 
-def build_purchase_details(df: pd.DataFrame) -> pd.DataFrame:
+def build_sales_details(df: pd.DataFrame, alias_index: PartnerAliasIndex | None = None) -> pd.DataFrame:
+    """売上高を、売掛金内訳優先・直入金次点で取引先別明細へ展開する。"""
+    journal = resolve_partner_columns(df)
+    codes = _tx_codes(journal)
+    n_groups = codes.max() + 1 if len(codes) else 0
+    is_credit_sales = _contains(journal["credit_account"], SALES_ACCOUNT_PATTERN).to_numpy()
+    is_debit_ar = _contains(journal["debit_account"], AR_ACCOUNT_PATTERN).to_numpy()
+    is_cash_sales = _contains(journal["debit_account"], CASH_ACCOUNT_PATTERN).to_numpy() & is_credit_sales
+    credit_amount = _amount_column(journal, "credit_amount")
+    debit_amount = _amount_column(journal, "debit_amount")
+    # 返品・売上取消は現方針どおり差し引かず、貸方売上の合計が正の取引だけを展開する。
+    totals = np.bincount(codes[is_credit_sales], weights=credit_amount[is_credit_sales], minlength=n_groups)
+
+    has_ar = np.bincount(codes[is_debit_ar], minlength=n_groups) > 0
+    has_cash = np.bincount(codes[is_cash_sales], minlength=n_groups) > 0
+    ar_partner = journal["ar_partner"].to_numpy(dtype=object)
+    sales_partner = journal["sales_partner"].to_numpy(dtype=object)
+    ar_source = np.where(has_cash[codes], "売掛金・直入金内訳", "売掛金内訳").astype(object)
+    allocations, unallocated = _allocate_by_priority(journal, codes, totals, (
+        ((is_debit_ar, ar_partner, debit_amount, ar_source),
+         (is_cash_sales & has_ar[codes], sales_partner, debit_amount, ar_source)),
+        ((is_cash_sales, sales_partner, debit_amount, "直入金売上"),),
+        ((is_credit_sales, sales_partner, credit_amount, "売上仕訳"),),
+    ))
+
+    if unallocated.any():
+        unknown_codes = np.flatnonzero(unallocated)
+        first_rows = np.unique(codes, return_index=True)[1]
+        allocations = pd.concat([allocations, pd.DataFrame({
+            "date": journal["date"].groupby(codes).min().take(unknown_codes).tolist(),
+            "transaction_no": journal["transaction_no"].take(first_rows[unknown_codes]).tolist(),
+            "partner": UNKNOWN_PARTNER,
+            "amount": totals[unknown_codes],
+            "source": "取引先復元不能",
+            "_code": unknown_codes,
+        })], ignore_index=True)
+    return _details_frame(allocations, alias_index)
+
+
+def build_purchase_details(df: pd.DataFrame, alias_index: PartnerAliasIndex | None = None) -> pd.DataFrame:
     """仕入・売上原価・外注費を取引先別明細へ展開する。"""
     journal = resolve_partner_columns(df)
-    journal["_tx_key"] = [
-        _tx_key(index, value) for index, value in zip(journal.index, journal["transaction_no"])
-    ]
-    records = []
-    for _, group in journal.groupby("_tx_key", sort=False):
-        purchase_rows = group[_contains(group["debit_account"], PURCHASE_ACCOUNT_PATTERN)].copy()
-        total_purchase = pd.to_numeric(purchase_rows.get("debit_amount"), errors="coerce").fillna(0.0).sum()
-        if total_purchase <= 0:
-            continue
-
-        # 同一行で仕入先を解決できる通常仕訳は、その金額を直接採用する。
-        purchase_rows["_candidate_partner"] = purchase_rows["purchase_partner"]
-        purchase_rows["_candidate_amount"] = purchase_rows["debit_amount"]
-        if purchase_rows["_candidate_partner"].notna().all():
-            _append_allocations(records, group, purchase_rows, total_purchase, "仕入仕訳")
-            continue
-
-        ap_rows = group[_contains(group["credit_account"], AP_ACCOUNT_PATTERN)].copy()
-        ap_rows["_candidate_partner"] = ap_rows["credit_partner"]
-        ap_rows["_candidate_amount"] = ap_rows["credit_amount"]
-        if _append_allocations(records, group, ap_rows, total_purchase, "買掛・未払内訳"):
-            continue
-
-        _append_allocations(records, group, purchase_rows, total_purchase, "仕入仕訳")
-
-    result = pd.DataFrame(records, columns=["date", "transaction_no", "partner", "amount", "source"])
-    if not result.empty:
-        result["partner"] = consolidate_partner_aliases(result["partner"]).fillna(UNKNOWN_PARTNER)
-    return result
-
-
-def build_direct_sales_details(df: pd.DataFrame) -> pd.DataFrame:
+    codes = _tx_codes(journal)
+    n_groups = codes.max() + 1 if len(codes) else 0
+    is_purchase = _contains(journal["debit_account"], PURCHASE_ACCOUNT_PATTERN).to_numpy()
+    is_credit_ap = _contains(journal["credit_account"], AP_ACCOUNT_PATTERN).to_numpy()
+    debit_amount = _amount_column(journal, "debit_amount")
+    credit_amount = _amount_column(journal, "credit_amount")
+    totals = np.bincount(codes[is_purchase], weights=debit_amount[is_purchase], minlength=n_groups)
+
+    purchase_partner = journal["purchase_partner"].to_numpy(dtype=object)
+    # 同一行で仕入先を解決できる通常仕訳は、その金額を直接採用する。
+    unresolved = is_purchase & pd.isna(purchase_partner)
+    fully_resolved = np.bincount(codes[unresolved], minlength=n_groups) == 0
+    allocations, _ = _allocate_by_priority(journal, codes, totals, (
+        ((is_purchase & fully_resolved[codes], purchase_partner, debit_amount, "仕入仕訳"),),
+        ((is_credit_ap, journal["credit_partner"].to_numpy(dtype=object), credit_amount, "買掛・未払内訳"),),
+        ((is_purchase, purchase_partner, debit_amount, "仕入仕訳"),),
+    ))
+    return _details_frame(allocations, alias_index)
+
+
+def build_direct_sales_details(df: pd.DataFrame, alias_index: PartnerAliasIndex | None = None) -> pd.DataFrame:
     """現預金／売上高の同一仕訳だけを、共通名寄せ済みで返す。"""
     journal = resolve_partner_columns(df)
     mask = _contains(journal["debit_account"], CASH_ACCOUNT_PATTERN) & _contains(
@@ -186,16 +272,23 @@ def build_direct_sales_details(df: pd.DataFrame) -> pd.DataFrame:
     direct = journal[mask].copy()
     if direct.empty:
         return pd.DataFrame(columns=["date", "transaction_no", "partner", "amount", "source", "description", "credit_account"])
-    direct["partner"] = consolidate_partner_aliases(direct["sales_partner"]).fillna(UNKNOWN_PARTNER)
+    direct["partner"] = consolidate_partner_aliases(
+        direct["sales_partner"], alias_index=alias_index
+    ).fillna(UNKNOWN_PARTNER)
     direct["amount"] = pd.to_numeric(direct["debit_amount"], errors="coerce").fillna(0.0)
     direct["source"] = direct["sales_partner_source"]
     return direct[["date", "transaction_no", "partner", "amount", "source", "description", "credit_account"]]
 
 
-def build_customer_relationship_events(df: pd.DataFrame) -> pd.DataFrame:
-    """売上計上額とは分離し、顧客との取引関係が確認できたイベントを返す。"""
+def build_customer_relationship_events(
+    df: pd.DataFrame, sales: pd.DataFrame | None = None, alias_index: PartnerAliasIndex | None = None
+) -> pd.DataFrame:
+    """売上計上額とは分離し、顧客との取引関係が確認できたイベントを返す。
+
+    sales に同じ仕訳から作成済みの売上明細を渡すと、再計算せずに使う。
+    """
     journal = resolve_partner_columns(df)
-    sales = build_sales_details(journal).copy()
+    sales = (build_sales_details(journal, alias_index=alias_index) if sales is None else sales).copy()
     if not sales.empty:
         sales["relationship_source"] = "売上計上"
 
@@ -217,7 +310,7 @@ def build_customer_relationship_events(df: pd.DataFrame) -> pd.DataFrame:
     ], ignore_index=True)
     if events.empty:
         return pd.DataFrame(columns=columns)
-    events["partner"] = consolidate_partner_aliases(events["partner"])
+    events["partner"] = consolidate_partner_aliases(events["partner"], alias_index=alias_index)
     events = events[events["partner"].notna() & ~events["partner"].isin(NON_PARTNER_LABELS)].copy()
     events["date"] = pd.to_datetime(events["date"], errors="coerce")
     events = events.dropna(subset=["date"])
@@ -230,13 +323,18 @@ def build_customer_relationship_events(df: pd.DataFrame) -> pd.DataFrame:
     return events[columns]
 
 
-def resolve_payment_partner_name(row):
-    """費用補助科目を支払先と誤認する場合は摘要へフォールバックする。"""
-    candidate = normalize_partner_name(row.get("payment_partner"))
-    debit_account = normalize_partner_name(row.get("debit_account"))
-    if pd.notna(candidate):
-        is_account_name = bool(pd.Series([str(candidate)]).str.contains(EXPENSE_NAME_PATTERN, regex=True).iloc[0])
-        if not is_account_name and candidate != debit_account:
-            return candidate
-    description = normalize_partner_name(row.get("description"))
-    return description if pd.notna(description) else UNKNOWN_PARTNER
+def resolve_payment_partner_names(df: pd.DataFrame) -> pd.Series:
+    """費用補助科目を支払先と誤認する場合は摘要へフォールバックする。正規化・判定は一意値ごとに1回だけ行う。"""
+    def column(name):
+        return df[name] if name in df.columns else pd.Series(pd.NA, index=df.index, dtype="object")
+
+    candidate = map_unique(column("payment_partner"), normalize_partner_name)
+    debit_account = map_unique(column("debit_account"), normalize_partner_name)
+    description = map_unique(column("description"), normalize_partner_name)
+    is_account_name = map_unique(
+        pd.Series(candidate), lambda value: pd.notna(value) and bool(_EXPENSE_NAME_RE.search(str(value)))
+    ).astype(bool)
+    same_as_account = pd.notna(debit_account) & (candidate.astype(str) == debit_account.astype(str))
+    use_candidate = pd.notna(candidate) & ~is_account_name & ~same_as_account
+    fallback = np.where(pd.notna(description), description, UNKNOWN_PARTNER)
+    return pd.Series(np.where(use_candidate, candidate, fallback), index=df.index, dtype="object")
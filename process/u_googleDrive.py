@@ -2,6 +2,20 @@ import streamlit as st
 import requests
 import base64
 import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# アップロード待ちファイルを置くアウトボックス。プロセスが落ちても次回起動時に再送する。
+DRIVE_OUTBOX_DIR = os.environ.get("DRIVE_OUTBOX_DIR", os.path.join(tempfile.gettempdir(), "tokumei_drive_outbox"))
+UPLOAD_WORKERS = 4
+UPLOAD_MAX_ATTEMPTS = 4
+UPLOAD_BACKOFF_SECONDS = 2.0
+# これより古いアウトボックスのファイルは再送せず破棄する（会計データ由来の成果物を長く残さないため）。
+OUTBOX_MAX_AGE_SECONDS = 24 * 60 * 60
 
 def upload_file_to_drive(file_bytes: bytes, filename: str, mime_type: str) -> str:
     """
@@ -54,3 +68,123 @@ def upload_pdf_to_drive(pdf_bytes: bytes, filename: str) -> str:
     PDFバイナリデータをGoogle Driveへアップロードします。
     """
     return upload_file_to_drive(pdf_bytes, filename, "application/pdf")
+
+
+class _UploadQueue:
+    """Google Drive へのアップロードをバックグラウンドで並列・再試行実行するキュー。"""
+
+    def __init__(self, outbox_dir: str):
+        self._outbox_dir = outbox_dir
+        self._executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="drive-upload")
+        self._lock = threading.Lock()
+        self._statuses = {}
+        os.makedirs(outbox_dir, exist_ok=True)
+        self._resume_pending()
+
+    def _paths(self, job_id: str):
+        base = os.path.join(self._outbox_dir, job_id)
+        return f"{base}.bin", f"{base}.json"
+
+    def _set_status(self, job_id: str, **status):
+        with self._lock:
+            self._statuses[job_id] = {**self._statuses.get(job_id, {}), **status}
+
+    def _resume_pending(self):
+        """前回プロセスで送り切れなかったアウトボックスのファイルを再投入する。"""
+        now = time.time()
+        for name in sorted(os.listdir(self._outbox_dir)):
+            if name.endswith(".tmp") and now - os.path.getmtime(os.path.join(self._outbox_dir, name)) > OUTBOX_MAX_AGE_SECONDS:
+                # 書き込み途中で止まったメタ情報の一時ファイル
+                os.remove(os.path.join(self._outbox_dir, name))
+                continue
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-len(".json")]
+            data_path, meta_path = self._paths(job_id)
+            if not os.path.exists(data_path) or now - os.path.getmtime(meta_path) > OUTBOX_MAX_AGE_SECONDS:
+                self._discard(job_id)
+                continue
+            try:
+                meta = self._read_meta(meta_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Google Drive Upload Queue: discarding unreadable outbox entry {job_id} ({e})")
+                self._discard(job_id)
+                continue
+            self._set_status(job_id, state="pending", filename=meta["filename"], file_id=None)
+            self._executor.submit(self._run, job_id)
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> dict:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return {"filename": meta["filename"], "mime_type": meta["mime_type"]}
+
+    def _discard(self, job_id: str):
+        for path in self._paths(job_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def enqueue(self, file_bytes: bytes, filename: str, mime_type: str) -> str:
+        """ファイルをアウトボックスへ書き出してから送信を予約し、ジョブIDを返す。"""
+        job_id = uuid.uuid4().hex
+        data_path, meta_path = self._paths(job_id)
+        with open(data_path, "wb") as f:
+            f.write(file_bytes)
+        # メタ情報は最後に一時ファイル経由で置き換え、再開時に中途半端なジョブを拾わないようにする。
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"filename": filename, "mime_type": mime_type}, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+        self._set_status(job_id, state="pending", filename=filename, file_id=None)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id: str):
+        data_path, meta_path = self._paths(job_id)
+        try:
+            meta = self._read_meta(meta_path)
+            with open(data_path, "rb") as f:
+                file_bytes = f.read()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Google Drive Upload Queue: outbox entry {job_id} is unreadable ({e})")
+            self._set_status(job_id, state="failed")
+            return
+
+        for attempt in range(1, UPLOAD_MAX_ATTEMPTS + 1):
+            self._set_status(job_id, state="uploading", attempts=attempt)
+            file_id = upload_file_to_drive(file_bytes, meta["filename"], meta["mime_type"])
+            if file_id:
+                self._set_status(job_id, state="success", file_id=file_id)
+                self._discard(job_id)
+                return
+            if attempt < UPLOAD_MAX_ATTEMPTS:
+                time.sleep(UPLOAD_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        # 再試行を使い切ったファイルはアウトボックスに残し、次回起動時に再送する。
+        self._set_status(job_id, state="failed")
+
+    def status(self, job_id: str) -> dict:
+        with self._lock:
+            return dict(self._statuses.get(job_id, {"state": "unknown"}))
+
+
+@st.cache_resource(show_spinner=False)
+def _upload_queue() -> _UploadQueue:
+    return _UploadQueue(DRIVE_OUTBOX_DIR)
+
+
+def enqueue_upload_to_drive(file_bytes: bytes, filename: str, mime_type: str) -> str:
+    """
+    ファイルをバックグラウンドのアップロードキューへ登録し、ジョブIDを返します。
+    送信結果は get_upload_status で確認します。
+    """
+    return _upload_queue().enqueue(file_bytes, filename, mime_type)
+
+
+def get_upload_status(job_id: str) -> dict:
+    """
+    アップロードジョブの状態を返します。
+    state は pending / uploading / success / failed / unknown のいずれかです。
+    """
+    return _upload_queue().status(job_id)
@@ -11,10 +11,28 @@ Googleスプレッドシート読み取り用の共通ヘルパー。
 
 接続先スプレッドシートは secrets.toml 側 ([connections.gsheets].spreadsheet)
 で固定しているため、呼び出し側はワークシート名だけを指定すればよい。
+
+起動時に必ず参照するワークシート(STARTUP_WORKSHEETS)は read_sheets で1回の
+batchGet にまとめて取得し、プロセス内のスナップショットとして保持する。
+スナップショットはログイン用資格情報インデックスの定期再読込と同時に更新される。
 """
+import re
+
+import gspread
+import pandas as pd
 import streamlit as st
+from gspread.utils import absolute_range_name, extract_id_from_url
+from pandas.io.parsers import TextParser
 from streamlit_gsheets import GSheetsConnection
 
+# 起動時にまとめて取得するワークシートと、それぞれの header 指定
+STARTUP_WORKSHEETS = {
+    "アクセス管理": "infer",
+    "問題の本質": None,
+    "AIプロンプト": None,
+}
+UNNAMED_COLUMN_PATTERN = re.compile(r"^Unnamed:\s\d+(?:_level_\d+)?$")
+
 
 def read_sheet(worksheet_name: str, header="infer", ttl: int = 0):
     """
@@ -28,3 +46,77 @@ def read_sheet(worksheet_name: str, header="infer", ttl: int = 0):
     """
     conn = st.connection("gsheets", type=GSheetsConnection)
     return conn.read(worksheet=worksheet_name, header=header, ttl=ttl, use_spinner=False)
+
+
+def _values_to_dataframe(values: list, header="infer") -> pd.DataFrame:
+    """batchGet の values を、conn.read と同じ規則(空行・無名の空列を除去)で DataFrame 化する。"""
+    if not values:
+        return pd.DataFrame()
+    width = max(len(row) for row in values)
+    rows = [list(row) + [""] * (width - len(row)) for row in values]
+    df = TextParser(rows, header=header).read()
+    df = df.dropna(how="all", axis=0)
+    empty_unnamed = [
+        label for label in df.columns
+        if UNNAMED_COLUMN_PATTERN.match(str(label)) and df[label].isna().all()
+    ]
+    return df.drop(columns=empty_unnamed)
+
+
+@st.cache_resource(show_spinner=False)
+def _spreadsheet() -> gspread.Spreadsheet:
+    """[connections.gsheets] のサービスアカウントで、接続先スプレッドシートを gspread の公開APIで開く。
+
+    GSheetsConnection はシートごとに values.get を発行し、Spreadsheet を公開していないため、
+    batchGet 用に同じ secrets から gspread のクライアントを作る。
+    """
+    secrets = st.secrets["connections"]["gsheets"].to_dict()
+    spreadsheet = secrets.pop("spreadsheet", None)
+    secrets.pop("worksheet", None)
+    client = gspread.service_account_from_dict(secrets)
+    if str(spreadsheet).startswith("http"):
+        return client.open_by_key(extract_id_from_url(spreadsheet))
+    return client.open(spreadsheet)
+
+
+def read_sheets(worksheet_names: list, header="infer") -> dict:
+    """
+    複数のワークシートを1回の batchGet リクエストで取得し、{シート名: DataFrame} で返す。
+
+    Parameters:
+        worksheet_names: シート名のリスト (例: ["アクセス管理", "問題の本質"])
+        header: read_sheet と同じ指定。シートごとに変える場合は {シート名: header} の辞書を渡す
+    """
+    # conn.read はシートごとに values.get を発行するため、gspread の Spreadsheet を直接使う。
+    response = _spreadsheet().values_batch_get(
+        [absolute_range_name(name) for name in worksheet_names],
+        params={"valueRenderOption": "UNFORMATTED_VALUE", "dateTimeRenderOption": "FORMATTED_STRING"},
+    )
+    frames = {}
+    for name, value_range in zip(worksheet_names, response.get("valueRanges", [])):
+        sheet_header = header.get(name, "infer") if isinstance(header, dict) else header
+        frames[name] = _values_to_dataframe(value_range.get("values", []), header=sheet_header)
+    return frames
+
+
+@st.cache_resource(show_spinner=False)
+def _startup_snapshot() -> dict:
+    return {}
+
+
+def warm_up_sheets() -> dict:
+    """STARTUP_WORKSHEETS を一括取得してスナップショットを差し替え、取得結果を返す。"""
+    frames = read_sheets(list(STARTUP_WORKSHEETS), header=STARTUP_WORKSHEETS)
+    _startup_snapshot().update(frames)
+    return frames
+
+
+def read_startup_sheet(worksheet_name: str) -> pd.DataFrame:
+    """
+    STARTUP_WORKSHEETS のスナップショットを返す。未取得の場合はその場で1シートだけ読む。
+    header は STARTUP_WORKSHEETS の指定に従う。
+    """
+    frame = _startup_snapshot().get(worksheet_name)
+    if frame is None:
+        return read_sheet(worksheet_name, header=STARTUP_WORKSHEETS.get(worksheet_name, "infer"), ttl=0)
+    return frame.copy()